@@ -0,0 +1,3 @@
+"""
+Performance benchmarks, ran against the local presets of the test server.
+"""
@@ -0,0 +1,67 @@
+"""
+Import time of ``tpb`` measured with ``python -X importtime``. Exits with a
+non zero status if the median import time exceeds the threshold or if a heavy
+dependency gets imported.
+
+    $ python -m benchmarks.imports --threshold 20
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+
+STATEMENT = 'import tpb; tpb.CATEGORIES; tpb.ORDERS'
+HEAVY = ['requests', 'lxml', 'dateutil', 'purl', 'numpy', 'sqlite3',
+         'concurrent.futures', 'aiohttp']
+_line = re.compile(r'import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)')
+
+
+def import_time(statement=STATEMENT):
+    """
+    Returns the cumulative microseconds spent importing tpb modules and the
+    list of heavy dependencies imported by statement.
+    """
+    code = '{0}; import sys; print(" ".join(sys.modules))'.format(statement)
+    root = os.path.join(os.path.dirname(__file__), '..')
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c',
+                                code], cwd=root, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, universal_newlines=True)
+    out, err = process.communicate()
+    total = 0
+    for match in _line.finditer(err):
+        cumulative, indent, module = match.groups()
+        # Only count top level imports, nested ones are already included
+        if not indent and module.split('.')[0] == 'tpb':
+            total += int(cumulative)
+    modules = out.split()
+    return total, [name for name in HEAVY if name in modules]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=9)
+    parser.add_argument('--threshold', type=float, default=20.0,
+                        help='maximum median import time in milliseconds')
+    args = parser.parse_args(argv)
+    times = []
+    for _ in range(args.repeat):
+        total, heavy = import_time()
+        times.append(total / 1000.0)
+    median = sorted(times)[len(times) // 2]
+    print('import tpb: {0:.2f} ms median over {1} runs'.format(
+        median, args.repeat))
+    failed = False
+    if heavy:
+        print('heavy dependencies imported: ' + ', '.join(heavy))
+        failed = True
+    if median > args.threshold:
+        print('above the {0:.2f} ms threshold'.format(args.threshold))
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
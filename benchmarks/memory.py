@@ -0,0 +1,38 @@
+"""
+Memory used per ``Torrent`` built from the top 100 preset page.
+
+    $ python -m benchmarks.memory
+"""
+
+import gc
+from os import path
+import tracemalloc
+
+from lxml import html
+
+from tpb.tpb import Top
+
+
+PRESETS_DIR = path.join(path.dirname(__file__), '..', 'tests', 'presets')
+
+
+def torrent_memory(copies=100):
+    """
+    Returns the bytes allocated per torrent when building copies of every
+    row of the top preset page.
+    """
+    with open(path.join(PRESETS_DIR, 'top.html')) as f:
+        page = html.fromstring(f.read())
+    top = Top('http://localhost')
+    rows = top._get_torrent_rows(page) * copies
+    gc.collect()
+    tracemalloc.start()
+    torrents = [top._build_torrent(row) for row in rows]
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size / float(len(torrents))
+
+
+if __name__ == '__main__':
+    print('{0:.0f} bytes per torrent'.format(torrent_memory()))
@@ -0,0 +1,54 @@
+"""
+Listing page parsing throughput of the reference row parser
+(``List._build_torrent``) against the fast one (``List._parse``).
+
+    $ python -m benchmarks.parsing
+"""
+
+from os import path
+import timeit
+
+from lxml import html
+
+from tpb.tpb import Recent, Search, Top
+
+
+PRESETS_DIR = path.join(path.dirname(__file__), '..', 'tests', 'presets')
+BASE_URL = 'http://localhost:8000'
+
+
+def presets():
+    """
+    Yield a (name, list, page text) tuple for every listing preset.
+    """
+    for name, torrents in [('search', Search(BASE_URL, 'tpb afk')),
+                           ('recent', Recent(BASE_URL)),
+                           ('top', Top(BASE_URL))]:
+        with open(path.join(PRESETS_DIR, name + '.html')) as f:
+            yield name, torrents, f.read()
+
+
+def reference(torrents, text):
+    return [torrents._build_torrent(row) for row in
+            torrents._get_torrent_rows(html.fromstring(text))]
+
+
+def fast(torrents, text):
+    return torrents._parse(text)
+
+
+def pages_per_second(parse, torrents, text, repeat=5, number=20):
+    """
+    Returns the best pages per second rate of parse over repeat runs.
+    """
+    best = min(timeit.repeat(lambda: parse(torrents, text),
+                             repeat=repeat, number=number))
+    return number / best
+
+
+if __name__ == '__main__':
+    for name, torrents, text in presets():
+        slow = pages_per_second(reference, torrents, text)
+        quick = pages_per_second(fast, torrents, text)
+        print('{0:<8} reference {1:8.1f} pages/s  fast {2:8.1f} pages/s  '
+              '({3:.2f}x)'.format(name, slow, quick, quick / slow))
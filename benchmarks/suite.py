@@ -0,0 +1,241 @@
+"""
+Reproducible benchmark suite ran against the local test server and its
+presets. Every benchmark reports operations per second, p50/p99 latencies and
+peak memory, results are written as JSON and compared against a stored
+baseline. The slow benchmarks run against a threaded server adding latency to
+every request, like a distant mirror.
+
+    $ python -m benchmarks.suite --output results.json
+    $ python -m benchmarks.suite --save-baseline
+
+Exits with a non zero status if a benchmark is slower than the baseline by
+more than the tolerance.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from benchmarks.parsing import presets
+from tests.server import TPBApp, constant, free_port, tpb as server
+from tpb.tpb import TPB, Search, parse_created
+
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+LATENCY = 0.02
+DATES = ['02-08 16:55', '11-03 2011', 'Today 08:15', 'Y-day 23:59',
+         '3 mins ago', '2013-05-04']
+
+
+def percentile(values, fraction):
+    """
+    Returns the value below which the given fraction of sorted values fall.
+    """
+    index = min(int(round(fraction * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def measure(operation, number, rounds=5, warmup=1, memory_runs=3):
+    """
+    Run operation number times per round and returns its best throughput
+    over the rounds and the latencies of all runs, then its peak memory over
+    a few separate runs as tracing allocations slows it down.
+    """
+    for _ in range(warmup):
+        operation()
+    latencies = []
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(number):
+            begin = time.perf_counter()
+            operation()
+            latencies.append(time.perf_counter() - begin)
+        total = time.perf_counter() - start
+        best = total if best is None else min(best, total)
+    tracemalloc.start()
+    for _ in range(min(number, memory_runs)):
+        operation()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    latencies.sort()
+    return {
+        'ops_per_sec': number / best,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'peak_memory_kib': peak / 1024.0,
+        'number': number * rounds,
+    }
+
+
+def benchmarks(url, slow_url):
+    """
+    Returns a (name, operation, number) tuple for every benchmark.
+    """
+    parsers = [('parse_' + name, (lambda t=torrents, p=text: t._parse(p)), 20)
+               for name, torrents, text in presets()]
+
+    client = TPB(url)
+
+    def fetch_page():
+        list(client.search('tpb afk'))
+
+    def multipage():
+        search = client.search('tpb afk', multipage=True)
+        list(itertools.islice(search, 90))
+
+    def multipage_prefetch():
+        search = client.search('tpb afk', multipage=True, prefetch=2)
+        list(itertools.islice(search, 90))
+
+    torrents = list(client.search('tpb afk'))
+
+    def hydrate():
+        for torrent in torrents:
+            torrent._info = torrent._files = None
+        for _, error in client.hydrate(torrents, concurrency=8):
+            assert error is None
+
+    def info_files():
+        torrent = torrents[0]
+        torrent._info = torrent._files = None
+        torrent.info
+        torrent.files
+
+    search = Search(url, 'tpb afk')
+
+    def url_build():
+        search.next()
+        str(search.url)
+
+    slow = TPB(slow_url)
+
+    def slow_multipage():
+        list(slow.search('tpb afk', multipage=True))
+
+    def slow_multipage_prefetch():
+        list(slow.search('tpb afk', multipage=True, prefetch=4))
+
+    def slow_multipage_parallel():
+        list(slow.search('tpb afk').parallel(concurrency=8))
+
+    slow_torrents = list(slow.search('tpb afk'))
+
+    def slow_hydrate():
+        for torrent in slow_torrents:
+            torrent._info = torrent._files = None
+        for _, error in slow.hydrate(slow_torrents, concurrency=16):
+            assert error is None
+
+    now = time.time()
+
+    def created():
+        for date in DATES:
+            parse_created(date, now)
+
+    return parsers + [
+        ('fetch_page', fetch_page, 20),
+        ('multipage', multipage, 5),
+        ('multipage_prefetch', multipage_prefetch, 5),
+        ('hydrate', hydrate, 3),
+        ('slow_multipage', slow_multipage, 2),
+        ('slow_multipage_prefetch', slow_multipage_prefetch, 2),
+        ('slow_multipage_parallel', slow_multipage_parallel, 2),
+        ('slow_hydrate', slow_hydrate, 2),
+        ('info_files', info_files, 20),
+        ('url_build', url_build, 10000),
+        ('created', created, 10000),
+    ]
+
+
+def run(only=None):
+    """
+    Start the test servers, run the benchmarks and returns their results.
+    """
+    slow = TPBApp(port=free_port(), latency={'*': constant(LATENCY)},
+                  pages=10, threaded=True)
+    server.start()
+    slow.start()
+    try:
+        results = {}
+        for name, operation, number in benchmarks(server.url, slow.url):
+            if only and name not in only:
+                continue
+            results[name] = measure(operation, number)
+        return results
+    finally:
+        slow.stop()
+        server.stop()
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the names of the benchmarks slower than the baseline by more than
+    the tolerance, as a fraction of the baseline throughput.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        expected = baseline.get('results', {}).get(name)
+        if expected is None:
+            continue
+        if result['ops_per_sec'] < expected['ops_per_sec'] * (1 - tolerance):
+            regressions.append(name)
+    return regressions
+
+
+def report(results, baseline):
+    print('{0:<24} {1:>12} {2:>9} {3:>9} {4:>11} {5:>9}'.format(
+        'benchmark', 'ops/sec', 'p50 ms', 'p99 ms', 'peak KiB', 'baseline'))
+    for name, result in sorted(results.items()):
+        expected = baseline.get('results', {}).get(name)
+        change = ''
+        if expected is not None:
+            change = '{0:+.0%}'.format(
+                result['ops_per_sec'] / expected['ops_per_sec'] - 1)
+        print('{0:<24} {1[ops_per_sec]:12.1f} {1[p50_ms]:9.3f} '
+              '{1[p99_ms]:9.3f} {1[peak_memory_kib]:11.1f} {2:>9}'.format(
+                  name, result, change))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run the TPB benchmark suite against the test server.')
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed throughput loss against the baseline')
+    parser.add_argument('benchmarks', nargs='*', help='benchmarks to run')
+    args = parser.parse_args(argv)
+
+    document = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': run(args.benchmarks),
+    }
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report(document['results'], baseline)
+    for path in [args.output, args.save_baseline and args.baseline]:
+        if path:
+            with open(path, 'w') as f:
+                json.dump(document, f, indent=2, sort_keys=True)
+    if args.save_baseline:
+        return 0
+    regressions = compare(document['results'], baseline, args.tolerance)
+    if regressions:
+        print('regressions: ' + ', '.join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
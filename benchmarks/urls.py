@@ -0,0 +1,41 @@
+"""
+URL handling micro benchmarks: creating searches, reading their URL and
+turning their pages.
+
+    $ python -m benchmarks.urls
+"""
+
+import timeit
+
+from tpb.tpb import Search
+from tpb.utils import URL
+
+
+BASE_URL = 'http://localhost:8000'
+
+
+def create():
+    URL(BASE_URL, '/search', ['query', 'page', 'order', 'category'],
+        ['tpb afk', '0', '7', '0'])
+
+
+def build(search=Search(BASE_URL, 'tpb afk')):
+    str(search.url)
+
+
+def turn_page(search=Search(BASE_URL, 'tpb afk')):
+    search.next()
+    str(search.url)
+
+
+def ops_per_second(func, repeat=5, number=10000):
+    """
+    Returns the best calls per second rate of func over repeat runs.
+    """
+    return number / min(timeit.repeat(func, repeat=repeat, number=number))
+
+
+if __name__ == '__main__':
+    for name, func in [('create', create), ('build', build),
+                       ('turn page', turn_page)]:
+        print('{0:<10} {1:12.0f} ops/s'.format(name, ops_per_second(func)))
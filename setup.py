@@ -1,14 +1,21 @@
 #!/usr/bin/env python
 
+import sys
+
 try:
     from setuptools import setup
 except ImportError:
     from distutils.core import setup
 
+install_requires = ['purl', 'dateutils', 'lxml', 'cssselect', 'requests']
+if sys.version_info < (3, 2):
+    install_requires.append('futures')
+
 setup(
     name='ThePirateBay',
     version='v1.3.5',
-    install_requires=['purl', 'dateutils', 'lxml', 'cssselect', 'requests'],
+    install_requires=install_requires,
+    extras_require={'async': ['aiohttp']},
     author='Karan Goel',
     author_email='karan@goel.im',
     packages=['tpb', 'tests'],
@@ -1,14 +1,58 @@
-from time import sleep
-from os import path
+from functools import wraps
+import math
 from multiprocessing import Process
+from os import path
+import random
+import socket
+import threading
+from time import sleep, time
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from bottle import Bottle, HTTPResponse, ServerAdapter, request, run, template
 
-from bottle import Bottle, route, run, template
+try:
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from SocketServer import ThreadingMixIn
 
 
 PRESETS_DIR = path.join(path.dirname(__file__), 'presets')
 
 
+def constant(seconds):
+    """
+    Latency distribution always returning the same delay.
+    """
+    return lambda: seconds
+
+
+def uniform(low, high):
+    """
+    Latency distribution uniformly drawn between low and high seconds.
+    """
+    return lambda: random.uniform(low, high)
+
+
+def lognormal(median, sigma=0.5):
+    """
+    Long tailed latency distribution around median seconds, like slow mirrors.
+    """
+    return lambda: random.lognormvariate(math.log(median), sigma)
+
+
+def free_port(host='localhost'):
+    """
+    Returns a port nobody is listening on.
+    """
+    sock = socket.socket()
+    sock.bind((host, 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
 def template_response(func):
+    @wraps(func)
     def wrapper(*args, **kwargs):
         filename = func(*args, **kwargs)
         with open(path.join(PRESETS_DIR, filename)) as f:
@@ -17,61 +61,210 @@ def template_response(func):
     return wrapper
 
 
+def simulated(name):
+    """
+    Delay the route by its configured latency and randomly answer with its
+    configured error statuses instead.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            app = request.app
+            latency = app.latency.get(name, app.latency.get('*'))
+            if latency is not None:
+                sleep(latency())
+            draw = random.random()
+            errors = app.errors.get(name, app.errors.get('*', {}))
+            for status, probability in errors.items():
+                if draw < probability:
+                    headers = {'Retry-After': '1'} if status == 429 else {}
+                    return HTTPResponse(status=status, body='Simulated error',
+                                        **headers)
+                draw -= probability
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ThreadedServer(ServerAdapter):
+
+    """
+    Multithreaded wsgiref server able to answer hundreds of concurrent
+    requests.
+    """
+
+    def run(self, app):
+        class Server(ThreadingMixIn, WSGIServer):
+            daemon_threads = True
+            request_queue_size = 1024
+
+        class Handler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        make_server(self.host, self.port, app, Server, Handler).serve_forever()
+
+
 class TPBApp(Bottle):
 
-    def __init__(self, host='localhost', port=8000):
+    """
+    Local TPB stand in serving the presets. For load testing it can add
+    latency and errors per route (search, recent, top, torrent, files or * for
+    every route), serve pages synthetic results instead of the presets and run
+    a threaded server.
+
+    Synthetic results list rows of unique torrents, newest first, and pages
+    after the last one are empty. With uploads, every listing request shifts
+    the results as if that many torrents had just been uploaded.
+    """
+
+    def __init__(self, host='localhost', port=8000, latency=None, errors=None,
+                 pages=None, rows=30, uploads=0, threaded=False):
         super(TPBApp, self).__init__()
         self.host = host
         self.port = port
+        self.latency = latency or {}
+        self.errors = errors or {}
+        self.pages = pages
+        self.rows = rows
+        self.uploads = uploads
+        self.threaded = threaded
         self.process = None
+        self._listings = 0
+        self._lock = threading.Lock()
+        for rule, callback in ROUTES:
+            self.route(rule)(callback)
 
     def run(self):
-        run(self, host=self.host, port=self.port, debug=False, quiet=True)
+        server = ThreadedServer if self.threaded else 'wsgiref'
+        run(self, server=server, host=self.host, port=self.port, debug=False,
+            quiet=True)
 
-    def start(self):
+    def start(self, timeout=10):
         self.process = Process(target=self.run)
         self.process.start()
-        sleep(1)
+        # Wait for the server to accept connections
+        deadline = time() + timeout
+        while True:
+            try:
+                socket.create_connection((self.host, self.port), 1).close()
+                return
+            except socket.error:
+                if time() > deadline:
+                    raise
+                sleep(0.01)
 
     def stop(self):
         self.process.terminate()
+        self.process.join()
         self.process = None
 
     @property
     def url(self):
         return 'http://{}:{}'.format(self.host, self.port)
 
-tpb = TPBApp()
+    def synthetic(self, kind, page):
+        """
+        Returns a synthetic results page of the given kind (search or recent).
+        """
+        with self._lock:
+            uploads = self._listings * self.uploads
+            self._listings += 1
+        if page >= self.pages:
+            return '<html><body><h2>No hits.</h2></body></html>'
+        first = self.rows * page
+        rows = []
+        for index in range(first, first + self.rows):
+            id = 1000000 + uploads - index
+            age = max(index - uploads, 0) + 1
+            meta = SYNTHETIC_META.format(id=id, age=age, size=id % 900 + 1)
+            rows.append(SYNTHETIC_ROW.format(id=id, age=age, meta=meta))
+        links = '&nbsp;'.join(
+            '<a href="/{0}/{1}">{2}</a>'.format(kind, number, number + 1)
+            for number in range(self.pages))
+        return SYNTHETIC_PAGE.format(rows=''.join(rows), pages=links)
+
+
+SYNTHETIC_PAGE = """<html><body>
+<table id="searchResult">
+<thead><tr class="header"><th>Type</th><th>Name</th><th>SE</th><th>LE</th></tr>
+</thead>
+{rows}
+</table>
+<div align="center">{pages}</div>
+</body></html>"""
+
+SYNTHETIC_META = ('Uploaded {age}&nbsp;mins&nbsp;ago, Size {size}&nbsp;MiB, '
+                  'ULed by <a class="detDesc" href="/user/uploader{id}/">'
+                  'uploader{id}</a>')
 
+SYNTHETIC_ROW = """<tr>
+<td class="vertTh"><center><a href="/browse/200">Video</a><br />
+<a href="/browse/201">Movies</a></center></td>
+<td><div class="detName"><a href="/torrent/{id}/Synthetic.{id}"
+ class="detLink">Synthetic {id}</a></div>
+<a href="magnet:?xt=urn:btih:{id:040d}"><img src="/static/img/icon-magnet.gif"
+ /></a><a href="/user/uploader{id}/"><img src="/static/img/vip.gif" title="VIP"
+ /></a>
+<font class="detDesc">{meta}</font></td>
+<td align="right">{id}</td>
+<td align="right">{age}</td>
+</tr>
+"""
 
-@tpb.route('/search/<query>/<page>/<ordering>/<category>')
+
+@simulated('search')
 @template_response
 def search(**kwargs):
     return 'search.html'
 
 
-@tpb.route('/recent/<page>')
+@simulated('recent')
 @template_response
 def recent(**kwargs):
     return 'recent.html'
 
 
-@tpb.route('/top/<category>')
+@simulated('top')
 @template_response
 def top(**kwargs):
     return 'top.html'
 
 
-@tpb.route('/torrent/<id>/<name>')
+@simulated('torrent')
 @template_response
 def torrent(**kwargs):
     return 'torrent.html'
 
 
-@tpb.route('/ajax_details_filelist.php')
+@simulated('files')
 @template_response
 def files(**kwargs):
     return 'files.html'
 
+
+def listing(kind, preset):
+    """
+    Listing route serving synthetic pages if configured, the preset otherwise.
+    """
+    @simulated(kind)
+    def wrapper(page, **kwargs):
+        if request.app.pages is not None:
+            return request.app.synthetic(kind, int(page))
+        return preset(page=page, **kwargs)
+    return wrapper
+
+
+ROUTES = [
+    ('/search/<query>/<page>/<ordering>/<category>',
+     listing('search', search)),
+    ('/recent/<page>', listing('recent', recent)),
+    ('/top/<category>', top),
+    ('/torrent/<id>/<name>', torrent),
+    ('/ajax_details_filelist.php', files),
+]
+
+tpb = TPBApp()
+
 if __name__ == '__main__':
     tpb.run()
@@ -2,22 +2,38 @@ from datetime import datetime, timedelta
 import itertools
 import sys
 import os
+import pickle
+import shutil
+import subprocess
+import tempfile
 import time
 import unittest
 
 from lxml import html
 
-from tpb.tpb import TPB, Search, Recent, Top, List, Paginated
+from tpb.tpb import TPB, Search, Recent, Top, List, Paginated, Torrent
+from tpb.tpb import BrokenPageError, created_parsers, parse_created
+from tpb.cache import Cache
+from tpb.columns import to_columns
+from tpb.coordinator import Coordinator, SQLiteQueue, Worker
+from tpb.dedup import BloomFilter, SeenSet
+from tpb.fanout import merge, order_key
+from tpb.feed import Watermark
+from tpb.stats import Histogram, Stats
+from tpb.store import Store
+from tpb.transport import BlockedError, RateLimiter, Transport
 from tpb.constants import ConstantType, Constants, ORDERS, CATEGORIES
-from tpb.utils import URL
+from tpb.utils import URL, parse_size
 
 if sys.version_info >= (3, 0):
     from urllib.request import urlopen
     from tests.cases import RemoteTestCase
+    from tests.server import TPBApp, constant, free_port
     unicode = str
 else:
     from urllib2 import urlopen
     from cases import RemoteTestCase
+    from server import TPBApp, constant, free_port
 
 
 class ConstantsTestCase(RemoteTestCase):
@@ -60,6 +76,39 @@ Alphanum:
         self.assertEqual(str(Alphanum), output)
 
 
+class LazyImportTestCase(RemoteTestCase):
+
+    def imported(self, statement):
+        code = statement + '; import sys; print(" ".join(sys.modules))'
+        root = os.path.join(os.path.dirname(__file__), '..')
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         cwd=root, universal_newlines=True)
+        return output.split()
+
+    def test_constants(self):
+        modules = self.imported('import tpb; tpb.CATEGORIES; tpb.ORDERS')
+        for heavy in ['requests', 'lxml', 'dateutil', 'purl', 'numpy',
+                      'sqlite3', 'concurrent.futures']:
+            self.assertFalse(heavy in modules, heavy)
+
+    def test_first_use(self):
+        modules = self.imported("import tpb; tpb.TPB('http://localhost')")
+        self.assertFalse('requests' in modules)
+        self.assertFalse('lxml' in modules)
+        modules = self.imported("from tpb import TPB, Store, Cache")
+        self.assertTrue('tpb.store' in modules)
+
+    def test_submodules(self):
+        modules = self.imported('import tpb; tpb.tpb.Search; '
+                                'tpb.constants.ORDERS')
+        self.assertTrue('tpb.tpb' in modules)
+        import tpb
+        self.assertTrue(tpb.coordinator.Worker is Worker)
+        self.assertRaises(AttributeError, getattr, tpb, 'missing')
+        for name in ['TPB', 'Stats', 'tpb', 'constants', 'pipeline']:
+            self.assertTrue(name in dir(tpb), name)
+
+
 class PathSegmentsTestCase(RemoteTestCase):
 
     def setUp(self):
@@ -83,6 +132,22 @@ class PathSegmentsTestCase(RemoteTestCase):
         self.url.gamma = '7'
         self.assertEqual(str(self.url), '/9/8/7')
 
+    def test_cached_classes(self):
+        same_url = URL('', '/', self.segments, ['3', '4', '5'])
+        self.assertTrue(type(same_url) is type(self.url))
+        other_url = URL('', '/', ['one'], ['1'])
+        self.assertFalse(type(other_url) is type(self.url))
+        self.assertEqual(str(same_url), '/3/4/5')
+        self.assertEqual(str(self.url), '/0/1/2')
+
+    def test_cached_build(self):
+        self.assertTrue(self.url.build() is self.url.build())
+        self.assertEqual(str(self.url.build(beta='7')), '/0/7/2')
+        self.assertEqual(str(self.url), '/0/1/2')
+        self.url.beta = '8'
+        self.assertEqual(str(self.url), '/0/8/2')
+        self.assertEqual(str(self.url.build()), '/0/8/2')
+
 
 class ParsingTestCase(RemoteTestCase):
 
@@ -111,6 +176,52 @@ class ParsingTestCase(RemoteTestCase):
         rows = self.torrents._get_torrent_rows(document.getroot())
         self.assertEqual(len(rows), 30)
 
+    def test_fast_parser(self):
+        for torrents, preset in [(self.torrents, 'search'),
+                                 (Recent(self.url), 'recent'),
+                                 (Top(self.url), 'top')]:
+            text = urlopen(str(torrents.url)).read().decode('utf-8')
+            rows = torrents._get_torrent_rows(html.fromstring(text))
+            expected = [torrents._build_torrent(row) for row in rows]
+            parsed = torrents._parse(text)
+            self.assertTrue(len(parsed) > 0, preset)
+            for a, b in zip(expected, parsed):
+                for name in ['title', 'url', 'id', 'category', 'sub_category',
+                             'magnet_link', 'torrent_link', 'comments',
+                             'has_cover', 'user_status', 'size', 'user',
+                             'seeders', 'leechers']:
+                    self.assertEqual(getattr(a, name), getattr(b, name))
+                self.assertEqual(a._created[0], b._created[0])
+            self.assertEqual(len(expected), len(parsed))
+
+    def test_stream(self):
+        for torrents in [self.torrents, Recent(self.url), Top(self.url)]:
+            expected = [(t.id, t.title, t.size, t._created[0])
+                        for t in torrents]
+            streamed = [(t.id, t.title, t.size, t._created[0])
+                        for t in torrents.stream(chunk_size=512)]
+            self.assertEqual(streamed, expected)
+
+    def test_stream_cache(self):
+        torrents = TPB(self.url, cache=Cache()).top().stream()
+        next(iter(torrents))
+        self.assertEqual(len(torrents.cache), 0)
+        self.assertEqual(len(list(torrents)), 100)
+        self.assertEqual(len(list(torrents)), 100)
+        self.assertEqual(torrents.cache.hits, 1)
+
+    def test_stream_rows(self):
+        stats = Stats()
+        torrents = TPB(self.url, stats=stats).top().stream()
+        self.assertEqual(len(list(torrents)), 100)
+        self.assertEqual(stats.counters['page.rows'], 100)
+
+    def test_broken_page(self):
+        empty = '<html><body><h2>No hits. Try again.</h2></body></html>'
+        self.assertEqual(self.torrents._parse(empty), [])
+        for broken in ['<html><body><p>Captcha</p></body></html>', '']:
+            self.assertRaises(BrokenPageError, self.torrents._parse, broken)
+
     def test_torrent_build(self):
         for torrent in self.torrents.items():
             if torrent.title == 'TPB.AFK.2013.720p.h264-SimonKlose' and\
@@ -151,6 +262,82 @@ class TorrentTestCase(RemoteTestCase):
         self.assertEqualDatetimes(torrent.created, datetime.now() -
                                   timedelta(days=1, seconds=1))
 
+    def test_compact(self):
+        torrents = list(self.torrents.items())
+        self.assertFalse(hasattr(torrents[0], '__dict__'))
+        self.assertTrue(torrents[0].category is torrents[1].category)
+        self.assertTrue(torrents[0].user_status is torrents[1].user_status)
+        torrent = torrents[0]
+        self.assertTrue(torrent.url.path().startswith('/torrent/'))
+        self.assertEqual(torrent.url.path_segments()[1], torrent.id)
+        torrent.url = torrent.url.path('/torrent/1/name')
+        self.assertEqual(str(torrent.url), self.url + '/torrent/1/name')
+
+    def test_numeric_fields(self):
+        self.assertEqual(parse_size('1.5 GiB'), 1610612736)
+        self.assertEqual(parse_size('73.53\xa0KiB'), 75294)
+        self.assertEqual(parse_size('12 B'), 12)
+        self.assertTrue(parse_size('unknown') is None)
+        for torrent in self.torrents.items():
+            self.assertEqual(torrent.size_bytes, parse_size(torrent.size))
+            self.assertEqual(datetime.fromtimestamp(torrent.timestamp),
+                             torrent.created.replace(microsecond=0))
+            self.assertEqual(torrent.ratio, torrent.seeders /
+                             float(max(torrent.leechers, 1)))
+
+    def test_columns(self):
+        torrents = list(self.torrents.items())
+        for use_numpy in [False, None]:
+            columns = to_columns(torrents, use_numpy)
+            self.assertEqual(len(columns['seeders']), len(torrents))
+            for i, torrent in enumerate(torrents):
+                self.assertEqual(columns['id'][i], int(torrent.id))
+                self.assertEqual(columns['size_bytes'][i], torrent.size_bytes)
+                self.assertEqual(columns['timestamp'][i], torrent.timestamp)
+                self.assertEqual(columns['title'][i], torrent.title)
+        self.assertEqual(len(self.torrents.to_columns()['ratio']), 30)
+        torrents[0].id = 'abc'
+        self.assertEqual(to_columns(torrents[:1])['id'][0], -1)
+
+    def test_created_lazy(self):
+        torrent = next(self.torrents.items())
+        self.assertTrue(torrent._parsed is None)
+        self.assertEqual(torrent.timestamp,
+                         time.mktime(torrent.created.timetuple()))
+
+    def test_created_memoized(self):
+        torrent = next(self.torrents.items())
+        self.assertTrue(torrent.created is torrent.created)
+        torrent._created = ('1 min ago', time.time())
+        self.assertEqualDatetimes(
+            torrent.created, datetime.now() - timedelta(minutes=1))
+
+    def test_created_parsers(self):
+        current = time.mktime((2014, 3, 2, 12, 0, 0, 0, 0, -1))
+        for timestamp, expected, parser in [
+                ('02-08 16:55', datetime(2014, 2, 8, 16, 55), 'day_time'),
+                ('11-03 2011', datetime(2011, 11, 3), 'day_year'),
+                ('Today 08:15', datetime(2014, 3, 2, 8, 15), 'relative_day'),
+                ('Y-day 23:59', datetime(2014, 3, 1, 23, 59), 'relative_day'),
+                ('3 mins ago', datetime(2014, 3, 2, 11, 57), 'ago'),
+                ('2013-05-04', datetime(2013, 5, 4), 'dateutil'),
+                ('???', datetime(2014, 3, 2, 12), 'failed')]:
+            count = created_parsers[parser]
+            self.assertEqual(parse_created(timestamp, current), expected)
+            self.assertEqual(created_parsers[parser], count + 1)
+
+    def test_pickle(self):
+        self.torrents.transport = Transport()
+        torrent = next(self.torrents.items())
+        torrent.created
+        copy = pickle.loads(pickle.dumps(torrent, pickle.HIGHEST_PROTOCOL))
+        for name in Torrent._pickled:
+            if name != '_parsed':
+                self.assertEqual(getattr(copy, name), getattr(torrent, name))
+        self.assertTrue(copy.category is torrent.category)
+        self.assertTrue(copy.transport is None)
+        self.assertEqual(copy.created, torrent.created)
+
     def test_info(self):
         for torrent in self.torrents.items():
             self.assertNotEqual('', torrent.info.strip())
@@ -180,7 +367,7 @@ class PaginationTestCase(RemoteTestCase):
 
             def items(self):
                 if self.pages_left == 0:
-                    raise StopIteration()
+                    return
                 for i in range(10):
                     yield i
                 self.pages_left -= 1
@@ -190,6 +377,40 @@ class PaginationTestCase(RemoteTestCase):
         self.torrents = DummySearch(self.url, 'tpb afk').multipage()
         self.assertEqual(len(list(iter(self.torrents))), 50)
 
+    def test_prefetch_items(self):
+        expected = list(itertools.islice(
+            Search(self.url, 'tpb afk').multipage().items(), 50))
+        self.torrents.multipage(prefetch=3)
+        items = list(itertools.islice(self.torrents.items(), 50))
+        self.assertEqual([t.id for t in items], [t.id for t in expected])
+        self.assertEqual(self.torrents.page(), 1)
+
+    def test_page_count(self):
+        self.assertEqual(self.torrents.page_count(), 3)
+        self.assertEqual(Recent(self.url).page_count(), 30)
+
+    def test_parallel(self):
+        expected = list(Search(self.url, 'tpb afk').multipage().limit(90))
+        items = list(self.torrents.parallel(concurrency=2))
+        self.assertEqual([t.id for t in items], [t.id for t in expected])
+        self.assertEqual(self.torrents.page(), 2)
+        items = list(self.torrents.page(0).parallel(ordered=False))
+        self.assertEqual(len(items), 90)
+
+    def test_prefetch_last_page(self):
+        class DummySearch(Search):
+            pages_left = 3
+
+            def _parse(self, text, url=None):
+                if self.pages_left == 0:
+                    return []
+                self.pages_left -= 1
+                return super(DummySearch, self)._parse(text, url)
+
+        self.torrents = DummySearch(self.url, 'tpb afk').multipage(prefetch=2)
+        self.assertEqual(len(list(iter(self.torrents))), 90)
+        self.assertEqual(self.torrents.page(), 3)
+
 
 class SearchTestCase(RemoteTestCase):
 
@@ -246,6 +467,56 @@ class TopTestCase(RemoteTestCase):
         self.assertEqual(len(list(self.torrents.items())), 100)
 
 
+class FilterTestCase(RemoteTestCase):
+
+    def setUp(self):
+        self.torrents = list(Top(self.url))
+
+    def assertTorrents(self, torrents, expected):
+        self.assertEqual([t.id for t in torrents], [t.id for t in expected])
+
+    def test_limit(self):
+        self.assertTorrents(Top(self.url).limit(5), self.torrents[:5])
+        self.assertEqual(list(Top(self.url).limit(0)), [])
+        self.assertEqual(len(list(TPB(self.url).top(limit=7))), 7)
+
+    def test_seeders(self):
+        expected = [t for t in self.torrents
+                    if t.seeders >= 5000 and t.leechers >= 1000]
+        torrents = Top(self.url).filter(min_seeders=5000, min_leechers=1000)
+        self.assertTorrents(torrents, expected)
+
+    def test_category(self):
+        sub_category = self.torrents[0].sub_category
+        expected = [t for t in self.torrents
+                    if sub_category in (t.category, t.sub_category)]
+        torrents = Top(self.url).filter(category=sub_category)
+        self.assertTorrents(torrents, expected)
+        torrents = Top(self.url).filter(category=[CATEGORIES.VIDEO.ALL,
+                                                  CATEGORIES.AUDIO.ALL])
+        self.assertTorrents(torrents, [t for t in self.torrents
+                                       if t.category in ('Video', 'Audio')])
+        for category in [CATEGORIES.ALL, [CATEGORIES.ALL, 'Audio']]:
+            torrents = Top(self.url).filter(category=category)
+            self.assertTorrents(torrents, self.torrents)
+
+    def test_predicate(self):
+        torrents = Top(self.url).filter(
+            min_seeders=5000, predicate=lambda t: t.comments > 0).limit(3)
+        expected = [t for t in self.torrents
+                    if t.seeders >= 5000 and t.comments > 0][:3]
+        self.assertTorrents(torrents, expected)
+
+    def test_cache(self):
+        cache = Cache()
+        top = Top(self.url)
+        top.cache = cache
+        list(top.filter(min_seeders=1000))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(len(list(top.filter())), 100)
+        self.assertEqual(len(cache), 1)
+
+
 class TPBTestCase(RemoteTestCase):
 
     def setUp(self):
@@ -275,6 +546,765 @@ class TPBTestCase(RemoteTestCase):
         self.assertTrue(isinstance(b_top, Top))
         self.assertEqual(str(a_top.url), str(b_top.url))
 
+    def test_transport(self):
+        search = self.tpb.search('tpb afk')
+        self.assertTrue(search.transport is self.tpb.transport)
+        torrent = next(iter(search))
+        self.assertTrue(torrent.transport is self.tpb.transport)
+        self.assertTrue(len(torrent.files) > 0)
+
+    def test_hydrate(self):
+        torrents = list(self.tpb.search('tpb afk'))
+        hydrated = list(self.tpb.hydrate(torrents, concurrency=4))
+        self.assertEqual(len(hydrated), len(torrents))
+        self._assertCountEqual([id(t) for t, _ in hydrated],
+                               [id(t) for t in torrents])
+        for torrent, error in hydrated:
+            self.assertTrue(error is None)
+            self.assertNotEqual('', torrent._info.strip())
+            self.assertTrue(len(torrent._files) > 0)
+
+    def test_hydrate_errors(self):
+        torrents = list(itertools.islice(self.tpb.search('tpb afk'), 3))
+        torrents[1].url = torrents[1].url.path('/missing')
+        hydrated = dict(self.tpb.hydrate(torrents, files=False))
+        self.assertTrue(hydrated[torrents[0]] is None)
+        self.assertTrue(isinstance(hydrated[torrents[1]], Exception))
+        self.assertTrue(hydrated[torrents[2]] is None)
+
+    def test_context_manager(self):
+        with TPB(self.url, timeout=5, pool_size=2) as tpb:
+            self.assertEqual(tpb.transport.timeout, 5)
+            self.assertEqual(len(list(tpb.top())), 100)
+
+
+class CacheTestCase(RemoteTestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.cache = Cache(ttls={'/recent': 10}, max_entries=3,
+                           max_bytes=100, clock=lambda: self.now)
+
+    def test_ttl(self):
+        self.cache.set('a', 1, '/recent')
+        self.cache.set('b', 2, '/top')
+        self.now = 10
+        self.assertTrue(self.cache.get('a') is None)
+        self.assertEqual(self.cache.get('b'), 2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_lru(self):
+        for key in 'abc':
+            self.cache.set(key, key, size=10)
+        self.cache.get('a')
+        self.cache.set('d', 'd', size=10)
+        self.assertFalse('b' in self.cache)
+        self.cache.set('e', 'e', size=95)
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.size, 95)
+        self.assertEqual(self.cache.evictions, 4)
+
+    def test_pages(self):
+        tpb = TPB(self.url, cache=Cache())
+        first = list(tpb.top())
+        second = list(tpb.top())
+        self.assertEqual(len(first), 100)
+        self.assertEqual([id(t) for t in first], [id(t) for t in second])
+        self.assertEqual((tpb.cache.hits, tpb.cache.misses), (1, 1))
+        search = tpb.search('tpb afk', multipage=True, prefetch=2)
+        list(itertools.islice(search, 40))
+        list(itertools.islice(search.page(0), 40))
+        self.assertEqual(tpb.cache.hits, 3)
+
+    def test_details(self):
+        tpb = TPB(self.url, cache=Cache())
+        torrent = next(iter(tpb.search('tpb afk')))
+        torrent.info
+        torrent._info = None
+        torrent.info
+        self.assertEqual((tpb.cache.hits, tpb.cache.misses), (1, 2))
+
+
+class StoreTestCase(RemoteTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'torrents.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_upsert(self):
+        with Store(self.path) as store:
+            tpb = TPB(self.url, store=store)
+            torrents = list(tpb.search('tpb afk'))
+            list(tpb.search('tpb afk'))
+            self.assertEqual(len(store), 30)
+            torrent = torrents[0]
+            info, files = torrent.info, torrent.files
+        with Store(self.path) as store:
+            stored = store.get(torrent.id)
+            self.assertEqual(stored.title, torrent.title)
+            self.assertEqual(str(stored.url), str(torrent.url))
+            self.assertEqual(stored._created[0], torrent._created[0])
+            self.assertEqual((stored._info, stored._files), (info, files))
+
+    def test_stream(self):
+        with Store(self.path) as store:
+            batches = []
+            upsert = store.upsert
+            store.upsert = lambda torrents: (batches.append(len(torrents)),
+                                             upsert(torrents))
+            tpb = TPB(self.url, store=store)
+            self.assertEqual(len(list(tpb.top().stream())), 100)
+            # Pages left early still store the torrents yielded
+            next(iter(tpb.search('tpb afk').stream()))
+            self.assertEqual(batches, [100, 1])
+            self.assertEqual(len(store), 101)
+
+    def test_offline_details(self):
+        class OfflineTransport(object):
+            def get(self, url):
+                raise AssertionError('Unexpected request to ' + url)
+
+        with Store(self.path) as store:
+            torrent = next(iter(TPB(self.url, store=store).top()))
+            info = torrent.info
+            torrent._info = None
+            torrent.transport = OfflineTransport()
+            self.assertEqual(torrent.info, info)
+
+    def test_load(self):
+        with Store(self.path) as store:
+            torrents = list(TPB(self.url, store=store).top())
+            video = [t for t in torrents if t.category == 'Video']
+            loaded = list(store.load(category='Video'))
+            self._assertCountEqual([t.id for t in loaded],
+                                   [t.id for t in video])
+            seeders = [t.seeders for t in loaded]
+            self.assertEqual(seeders, sorted(seeders, reverse=True))
+            self.assertTrue(all(t.seeders >= 1000
+                                for t in store.load(min_seeders=1000)))
+
+
+class StatsTestCase(RemoteTestCase):
+
+    def setUp(self):
+        self.stats = Stats()
+        self.events = []
+        self.stats.add_hook(lambda *event: self.events.append(event))
+        self.tpb = TPB(self.url, stats=self.stats)
+
+    def test_pages(self):
+        torrents = list(self.tpb.search('tpb afk'))
+        counters = self.stats.counters
+        self.assertEqual(counters['page.rows'], len(torrents))
+        self.assertGreater(counters['page.bytes'], 0)
+        for step in ['fetch', 'decode', 'parse', 'build', 'total']:
+            self.assertEqual(self.stats.histograms['page.' + step].count, 1)
+        url = str(self.tpb.search('tpb afk').url)
+        self.assertIn(('page.rows', len(torrents), url), self.events)
+        self.assertIs(torrents[0].stats, self.stats)
+
+    def test_stream(self):
+        torrents = list(self.tpb.search('tpb afk').stream())
+        self.assertEqual(self.stats.counters['page.rows'], len(torrents))
+        self.assertEqual(self.stats.histograms['page.total'].count, 1)
+
+    def test_details(self):
+        torrent = next(iter(self.tpb.top()))
+        torrent.info
+        torrent.files
+        for prefix in ['info', 'files']:
+            self.assertGreater(self.stats.counters[prefix + '.bytes'], 0)
+            self.assertEqual(
+                self.stats.histograms[prefix + '.parse'].count, 1)
+
+    def test_failures(self):
+        torrent = next(iter(self.tpb.top()))
+        torrent._url = self.url + '/recent/0'
+        self.assertRaises(Exception, lambda: torrent.info)
+        self.assertEqual(self.stats.counters['info.failures'], 1)
+
+    def test_export(self):
+        list(self.tpb.top())
+        snapshot = self.stats.snapshot()
+        self.assertEqual(snapshot['timings']['page.total']['count'], 1)
+        exported = self.stats.export()
+        self.assertIn('tpb_page_rows_total 100', exported)
+        self.assertIn('tpb_page_fetch_seconds_bucket{le="+Inf"} 1', exported)
+        self.stats.reset()
+        self.assertEqual(self.stats.snapshot(),
+                         {'counters': {}, 'timings': {}})
+
+    def test_histogram(self):
+        histogram = Histogram([1, 2, 4])
+        for value in [0.5, 1.5, 1.5, 3, 10]:
+            histogram.observe(value)
+        self.assertEqual(histogram.buckets, [1, 2, 1, 1])
+        self.assertEqual((histogram.min, histogram.max), (0.5, 10))
+        self.assertEqual(histogram.percentile(0), 0.5)
+        self.assertEqual(histogram.percentile(1), 10)
+        self.assertTrue(1 <= histogram.percentile(0.5) <= 2)
+
+
+class DedupTestCase(RemoteTestCase):
+
+    def test_seen_set(self):
+        seen = SeenSet(capacity=2)
+        self.assertTrue(seen.add('a'))
+        self.assertFalse(seen.add('a'))
+        self.assertTrue(seen.add('b'))
+        self.assertTrue(seen.add('c'))
+        self.assertEqual(len(seen), 2)
+        self.assertFalse('a' in seen)
+        self.assertTrue('c' in seen)
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        added = [bloom.add(str(i)) for i in range(1000)]
+        self.assertTrue(sum(added) > 980)
+        self.assertTrue(all(str(i) in bloom for i in range(1000)))
+        self.assertFalse(bloom.add('0'))
+        false_positives = sum(str(i) in bloom for i in range(1000, 11000))
+        self.assertTrue(false_positives < 300)
+
+    def test_reiteration(self):
+        class TwoPagesSearch(Search):
+            def _parse(self, text, url=None):
+                if self.page() >= 2:
+                    return []
+                return super(TwoPagesSearch, self)._parse(text, url)
+
+        search = TwoPagesSearch(self.url, 'tpb afk').multipage().dedup()
+        self.assertEqual(len(list(search)), 30)
+        self.assertEqual(search.duplicates, 30)
+        search.page(1)
+        self.assertEqual(len(list(search)), 30)
+        self.assertEqual(search.duplicates, 0)
+
+
+class FanOutTestCase(RemoteTestCase):
+
+    def setUp(self):
+        self.torrents = list(Top(self.url))
+
+    def test_order_keys(self):
+        for order, name, reverse in [
+                (ORDERS.SEEDERS.DES, 'seeders', True),
+                (ORDERS.SIZE.ASC, 'size_bytes', False),
+                (ORDERS.NAME.DES, 'title', True),
+                (ORDERS.UPLOADER.ASC, 'user', False)]:
+            expected = sorted(self.torrents,
+                              key=lambda t: getattr(t, name), reverse=reverse)
+            ordered = sorted(self.torrents, key=order_key(order))
+            self.assertEqual([getattr(t, name) for t in ordered],
+                             [getattr(t, name) for t in expected])
+
+    def test_merge(self):
+        class PageSearch(Search):
+            # Every page of the same sorted preset, like a single page list
+            def _parse(self, text, url=None):
+                if self.page() >= 1:
+                    return []
+                return sorted(super(PageSearch, self)._parse(text, url),
+                              key=lambda t: -t.leechers)
+
+        searches = [PageSearch(self.url, query) for query in 'ab']
+        torrents = list(merge(searches, ORDERS.LEECHERS.DES))
+        self.assertEqual(len(torrents), 30)
+        leechers = [t.leechers for t in torrents]
+        self.assertEqual(leechers, sorted(leechers, reverse=True))
+        searches = [PageSearch(self.url, query) for query in 'ab']
+        self.assertEqual(len(list(merge(searches, 9, limit=5))), 5)
+
+    def test_merge_orders(self):
+        class SizeSearch(Search):
+            def _parse(self, text, url=None):
+                if self.page() >= 1:
+                    return []
+                items = super(SizeSearch, self)._parse(text, url)
+                # Each list holds different torrents, sorted by size
+                items = items[int(self.url.query == 'b')::2]
+                return sorted(items, key=lambda t: t.size_bytes)
+
+        searches = [SizeSearch(self.url, query) for query in 'ab']
+        torrents = list(merge(searches, ORDERS.SIZE.ASC))
+        self.assertEqual(len(torrents), 30)
+        sizes = [t.size_bytes for t in torrents]
+        self.assertEqual(sizes, sorted(sizes))
+        self.assertRaises(ValueError, order_key, ORDERS.TYPE.DES)
+        self.assertRaises(ValueError, list, merge(searches, ORDERS.TYPE.ASC))
+
+
+class WatermarkTestCase(RemoteTestCase):
+
+    def setUp(self):
+        self.torrents = list(Recent(self.url))
+
+    def test_covers(self):
+        newest = max(self.torrents, key=lambda t: int(t.id))
+        watermark = Watermark()
+        self.assertFalse(watermark.covers(newest))
+        for torrent in self.torrents:
+            watermark.advance(torrent)
+        self.assertEqual(watermark.id, int(newest.id))
+        self.assertTrue(all(watermark.covers(t) for t in self.torrents))
+        by_time = Watermark(timestamp=watermark.timestamp)
+        self.assertTrue(by_time.covers(newest))
+
+    def test_persistence(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'watermark.json')
+        self.assertTrue(Watermark.load(path).empty)
+        watermark = Watermark(1234, 5678.5)
+        watermark.save(path)
+        self.assertEqual(Watermark.load(path), watermark)
+        self.assertEqual(Watermark.from_json(watermark.to_json()), watermark)
+
+
+class WorkQueueTestCase(RemoteTestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.queue = SQLiteQueue(clock=lambda: self.now)
+        self.addCleanup(self.queue.close)
+        self.coordinator = Coordinator(self.queue)
+
+    def test_add(self):
+        self.assertEqual(self.coordinator.search('tpb afk', pages=3), 3)
+        self.assertEqual(self.coordinator.search('tpb afk', pages=4), 1)
+        self.assertEqual(self.coordinator.top(CATEGORIES.VIDEO.ALL), 1)
+        self.assertEqual(self.coordinator.recent(), 1)
+        self.assertEqual(self.coordinator.progress(), {'pending': 6})
+
+    def test_leases(self):
+        self.coordinator.search('tpb afk', pages=2)
+        first = self.queue.claim('a', lease=10)
+        self.assertEqual((first.page, first.attempts), (0, 1))
+        self.assertEqual(self.queue.claim('b', lease=60).page, 1)
+        self.assertIsNone(self.queue.claim('c', lease=10))
+        # A restarted worker gets its page back, as another attempt
+        resumed = self.queue.claim('a', lease=10)
+        self.assertEqual((resumed.id, resumed.attempts), (first.id, 2))
+        # Pages of dead workers are claimed again once their lease expired
+        self.now += 11
+        again = self.queue.claim('c', lease=10)
+        self.assertEqual((again.id, again.attempts), (first.id, 3))
+        self.assertFalse(self.queue.complete(first, 'a'))
+        self.assertTrue(self.queue.complete(again, 'c'))
+        self.assertIsNone(self.queue.claim('a', lease=10))
+        self.assertEqual(self.queue.counts(), {'done': 1, 'leased': 1})
+
+    def test_retries(self):
+        self.coordinator.search('tpb afk', pages=1)
+        unit = self.queue.claim('a')
+        self.queue.retry(unit, 'a', 'IOError', delay=5)
+        self.assertIsNone(self.queue.claim('a'))
+        self.now += 5
+        unit = self.queue.claim('a')
+        self.assertEqual(unit.attempts, 2)
+        self.queue.fail(unit, 'a', 'IOError')
+        self.assertEqual([(u.id, error) for u, error in self.queue.errors()],
+                         [(unit.id, 'IOError')])
+
+    def test_worker(self):
+        self.coordinator.search('tpb afk')
+        self.coordinator.top()
+        pages = []
+        worker = Worker(self.queue, TPB(self.url), 'a')
+        done = worker.run(lambda unit, torrents: pages.append(
+            (unit.kind, unit.page, len(torrents))))
+        self.assertEqual(done, 4)
+        self.assertEqual(pages, [('search', 0, 30), ('top', 0, 100),
+                                 ('search', 1, 30), ('search', 2, 30)])
+        self.assertEqual(self.coordinator.progress(), {'done': 4})
+
+    def test_worker_failures(self):
+        self.coordinator.search('tpb afk', pages=1)
+        delays = []
+
+        def handle(unit, torrents):
+            raise ValueError('unit {0}'.format(unit.page))
+
+        def sleep(seconds):
+            delays.append(seconds)
+            self.now += seconds
+
+        worker = Worker(self.queue, TPB(self.url), 'a', max_attempts=2,
+                        backoff=1, sleep=sleep)
+        self.assertEqual(worker.run(handle, poll=1), 0)
+        self.assertEqual(delays, [1])
+        self.assertEqual(self.queue.errors()[0][1], 'ValueError: unit 0')
+
+    def test_worker_restarts(self):
+        self.coordinator.search('tpb afk', pages=1)
+        worker = Worker(self.queue, TPB(self.url), 'a', max_attempts=2)
+        # The worker keeps dying on its unit until it is given up
+        for _ in range(2):
+            self.queue.claim('a')
+        self.assertFalse(worker.process(self.queue.claim('a')))
+        self.assertEqual(self.queue.counts(), {'failed': 1})
+
+    def test_worker_lost_lease(self):
+        self.coordinator.search('tpb afk', pages=1)
+        pages = []
+        worker = Worker(self.queue, TPB(self.url), 'a', lease=10)
+        unit = self.queue.claim('a', lease=10)
+        self.now += 11
+        self.queue.claim('b')
+        self.assertFalse(worker.process(unit, lambda *args: pages.append(
+            args)))
+        self.assertEqual(pages, [])
+        self.assertEqual(self.queue.counts(), {'leased': 1})
+
+
+class RateLimiterTestCase(RemoteTestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.waits = []
+        self.limiter = RateLimiter(rate=2, burst=1, max_rate=3,
+                                   clock=lambda: self.now, sleep=self.sleep)
+
+    def sleep(self, seconds):
+        self.waits.append(seconds)
+        self.now += seconds
+
+    def test_bucket(self):
+        for _ in range(3):
+            self.limiter.acquire('a')
+        self.assertEqual(self.waits, [0.5, 0.5])
+        self.limiter.acquire('b')
+        self.assertEqual(len(self.waits), 2)
+
+    def test_adaptive(self):
+        self.limiter.throttled('a')
+        self.assertEqual(self.limiter.rate_of('a'), 1)
+        self.assertEqual(self.limiter.rate_of('b'), 2)
+        for _ in range(30):
+            self.limiter.succeeded('a')
+        self.assertEqual(self.limiter.rate_of('a'), 3)
+
+    def test_unlimited(self):
+        limiter = RateLimiter(clock=lambda: self.now, sleep=self.sleep)
+        for _ in range(8):
+            limiter.acquire('a')
+        self.assertEqual(self.waits, [])
+        limiter.throttled('a')
+        self.assertEqual(limiter.rate_of('a'), 4)
+
+
+class LoadServerTestCase(unittest.TestCase):
+
+    def start(self, latency=None, errors=None, pages=None, rows=30,
+              uploads=0, threaded=False, **kwargs):
+        server = TPBApp(port=free_port(), latency=latency, errors=errors,
+                        pages=pages, rows=rows, uploads=uploads,
+                        threaded=threaded)
+        server.start()
+        self.addCleanup(server.stop)
+        return TPB(server.url, **kwargs)
+
+    def test_synthetic_pages(self):
+        tpb = self.start(pages=4, rows=10, threaded=True)
+        torrents = list(tpb.search('synthetic', multipage=True))
+        self.assertEqual(len(torrents), 40)
+        self.assertEqual(len(set(t.id for t in torrents)), 40)
+        ids = [int(t.id) for t in torrents]
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(len(list(tpb.recent().multipage())), 40)
+
+    def test_uploads(self):
+        tpb = self.start(pages=2, rows=10, uploads=3)
+        first = list(tpb.recent(0))
+        second = list(tpb.recent(1))
+        self.assertEqual([t.id for t in first[-3:]],
+                         [t.id for t in second[:3]])
+
+    def test_dedup(self):
+        tpb = self.start(pages=3, rows=10, uploads=3)
+        recent = tpb.recent().multipage()
+        self.assertEqual(len(list(recent)), 30)
+        for dedup in [{}, {'bloom': True}, {'key': 'infohash'}]:
+            recent = tpb.recent().multipage().dedup(**dedup)
+            torrents = list(recent)
+            self.assertEqual(len(set(t.id for t in torrents)), len(torrents))
+            self.assertEqual(len(torrents) + recent.duplicates, 30)
+            self.assertEqual(recent.duplicates, 6)
+
+    def test_limit(self):
+        stats = Stats()
+        tpb = self.start(pages=10, rows=10, stats=stats)
+        torrents = list(tpb.search('synthetic', multipage=True, limit=25))
+        self.assertEqual(len(torrents), 25)
+        self.assertEqual(stats.histograms['page.fetch'].count, 3)
+        torrents = list(tpb.search('synthetic', multipage=True, prefetch=2,
+                                   limit=15))
+        self.assertEqual(len(torrents), 15)
+
+    def test_filtered_pages(self):
+        tpb = self.start(pages=4, rows=10)
+        # The first page is entirely filtered out
+        search = tpb.search('synthetic', multipage=True).filter(
+            predicate=lambda t: int(t.id) < 999975)
+        self.assertEqual(len(list(search)), 14)
+        search = tpb.search('synthetic', multipage=True).filter(
+            min_seeders=999990).stream()
+        self.assertEqual(len(list(search)), 11)
+
+    def test_parallel(self):
+        tpb = self.start(latency={'*': constant(0.05)}, pages=30, rows=10,
+                         threaded=True)
+        self.assertEqual(tpb.search('synthetic').page_count(), 30)
+        for ordered in [True, False]:
+            start = time.time()
+            search = tpb.search('synthetic').parallel(30, ordered)
+            torrents = list(search)
+            # About two round trips instead of 30
+            self.assertLess(time.time() - start, 0.75)
+            self.assertEqual(len(set(t.id for t in torrents)), 300)
+        ids = [int(t.id) for t in tpb.search('synthetic').parallel(30)]
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
+    def test_page_count_cache(self):
+        stats = Stats()
+        tpb = self.start(pages=4, rows=10, cache=Cache(), stats=stats)
+        list(tpb.recent())
+        # Page counts are cached along with the torrents
+        self.assertEqual(tpb.recent().page_count(), 4)
+        self.assertEqual(stats.histograms['page.fetch'].count, 1)
+        self.assertEqual(len(list(tpb.recent().parallel())), 40)
+        self.assertEqual(len(list(tpb.recent().parallel())), 40)
+        self.assertEqual(stats.histograms['page.fetch'].count, 4)
+        # Counts are kept for the page actually loaded
+        recent = tpb.recent()
+        list(recent.feed(max_pages=2))
+        self.assertEqual(recent._page_total(recent._page_url(1)), 4)
+        self.assertIsNone(recent._page_total(str(recent.url)))
+
+    def test_pipeline(self):
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(2)
+        self.addCleanup(executor.shutdown)
+        tpb = self.start(pages=6, rows=20, threaded=True)
+        expected = [t.id for t in tpb.search('synthetic', multipage=True)]
+        search = tpb.search('synthetic').pipeline(concurrency=3, backlog=4,
+                                                  executor=executor)
+        torrents = list(search)
+        self.assertEqual([t.id for t in torrents], expected)
+        self.assertEqual(search.page(), 5)
+        self.assertTrue(torrents[0].transport is tpb.transport)
+        search = tpb.search('synthetic').pipeline(ordered=False,
+                                                  executor=executor)
+        self.assertEqual(sorted(t.id for t in search), sorted(expected))
+        # Row criteria are checked by the workers, predicates locally
+        search = tpb.search('synthetic', limit=5).filter(
+            min_seeders=999950, predicate=lambda t: t.id.endswith('0'))
+        torrents = list(search.pipeline(executor=executor))
+        self.assertEqual([t.id for t in torrents],
+                         ['1000000', '999990', '999980', '999970', '999960'])
+
+    def test_pipeline_cache(self):
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(2)
+        self.addCleanup(executor.shutdown)
+        stats = Stats()
+        tpb = self.start(pages=4, rows=10, cache=Cache(), stats=stats)
+        list(tpb.recent())
+        for _ in range(2):
+            torrents = list(tpb.recent().pipeline(executor=executor))
+            self.assertEqual(len(torrents), 40)
+        self.assertEqual(stats.histograms['page.fetch'].count, 4)
+        # Streamed pages are cached without their page count
+        list(tpb.search('synthetic').stream())
+        search = tpb.search('synthetic').pipeline(executor=executor)
+        self.assertEqual(len(list(search)), 40)
+
+    def test_work_queue(self):
+        import threading
+        stats = Stats()
+        tpb = self.start(pages=12, rows=10, threaded=True, stats=stats)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'queue.db')
+        Coordinator(SQLiteQueue(path)).search('synthetic')
+        ids, lock = [], threading.Lock()
+
+        def handle(unit, torrents):
+            with lock:
+                ids.extend(t.id for t in torrents)
+
+        def work(name):
+            with SQLiteQueue(path) as queue:
+                Worker(queue, tpb, name).run(handle, poll=0.01)
+
+        workers = [threading.Thread(target=work, args=(str(i),))
+                   for i in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(len(ids), 120)
+        self.assertEqual(len(set(ids)), 120)
+        # No page was requested twice
+        self.assertEqual(stats.histograms['page.fetch'].count, 12)
+
+    def test_feed(self):
+        tpb = self.start(pages=5, rows=10, uploads=3)
+        watermark = Watermark()
+        torrents = list(tpb.recent().feed(watermark))
+        self.assertEqual(len(torrents), 10)
+        self.assertEqual(watermark.id, 1000000)
+        torrents = list(tpb.recent().feed(watermark))
+        self.assertEqual([t.id for t in torrents],
+                         ['1000003', '1000002', '1000001'])
+        self.assertEqual(watermark.id, 1000003)
+        torrents = list(tpb.recent().feed(watermark, oldest_first=True))
+        self.assertEqual([t.id for t in torrents],
+                         ['1000004', '1000005', '1000006'])
+        self.assertEqual(watermark.id, 1000006)
+
+    def test_feed_pages(self):
+        tpb = self.start(pages=5, rows=10, uploads=2)
+        watermark = Watermark(999975)
+        torrents = list(tpb.recent().feed(watermark))
+        ids = [int(t.id) for t in torrents]
+        # Rows shifting to the next pages are only yielded once
+        self.assertEqual(ids, list(range(1000000, 999975, -1)))
+        self.assertEqual(watermark.id, 1000000)
+        torrents = list(tpb.recent().feed(Watermark(0), max_pages=2))
+        self.assertTrue(len(torrents) <= 20)
+
+    def test_fan_out(self):
+        stats = Stats()
+        tpb = self.start(pages=5, rows=10, uploads=0, threaded=True,
+                         stats=stats)
+        torrents = list(tpb.fan_out(['a', 'b', 'c'], limit=25))
+        self.assertEqual([int(t.id) for t in torrents],
+                         list(range(1000000, 999975, -1)))
+        # Deeper pages are not needed by the top 25
+        self.assertTrue(stats.histograms['page.total'].count <= 9)
+        torrents = list(tpb.fan_out('a', categories=[0, 200]))
+        self.assertEqual(len(torrents), 50)
+        seeders = [t.seeders for t in torrents]
+        self.assertEqual(seeders, sorted(seeders, reverse=True))
+
+    def test_latency(self):
+        tpb = self.start(latency={'*': constant(0.2)})
+        start = time.time()
+        list(tpb.top())
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+    def test_errors(self):
+        tpb = self.start(errors={'search': {429: 1.0}, 'top': {503: 1.0}},
+                         retries=0)
+        torrents = list(tpb.recent())
+        self.assertEqual(len(torrents), 30)
+        response = tpb.transport.get(tpb.top().url)
+        self.assertEqual(response.status_code, 503)
+        self.assertRaises(BlockedError, list, tpb.top())
+        response = tpb.transport.get(tpb.search('throttled').url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+    @unittest.skipIf(sys.version_info < (3, 6), 'requires Python 3.6+')
+    def test_async_errors(self):
+        import asyncio
+        from tpb.aio import AsyncTPB
+        t = AsyncTPB(self.start(errors={'top': {503: 1.0}}).base_url)
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        self.addCleanup(loop.run_until_complete, t.close())
+        self.assertRaises(BlockedError, loop.run_until_complete,
+                          t.top().items().__anext__())
+
+    def test_retries(self):
+        tpb = self.start(errors={'top': {503: 0.3}}, retries=20,
+                         max_backoff=0.01)
+        for _ in range(5):
+            self.assertEqual(len(list(tpb.top())), 100)
+
+    def test_throttling(self):
+        tpb = self.start(errors={'search': {429: 1.0}}, retries=2,
+                         backoff=0, max_backoff=0,
+                         limiter=RateLimiter(min_rate=50))
+        limiter = tpb.transport.limiter
+        host = tpb.base_url.split('//')[1]
+        self.assertIsNone(limiter.rate_of(host))
+        self.assertRaises(BlockedError, list, tpb.search('throttled'))
+        self.assertEqual(limiter.rate_of(host), 50)
+
+
+class MirrorsTestCase(unittest.TestCase):
+
+    def start(self, **kwargs):
+        server = TPBApp(port=free_port(), threaded=True, **kwargs)
+        server.start()
+        self.addCleanup(server.stop)
+        return server.url
+
+    def test_failover(self):
+        broken = self.start(errors={'*': {503: 1.0}})
+        working = self.start()
+        tpb = TPB([broken, working], retries=0)
+        torrents = list(tpb.top())
+        self.assertEqual(len(torrents), 100)
+        self.assertTrue(str(torrents[0].url).startswith(broken))
+        self.assertTrue(len(torrents[0].info) > 0)
+        self.assertEqual(tpb.transport.failovers, 2)
+        self.assertEqual([m.url for m in tpb.transport.ranking()],
+                         [working, broken])
+        self.assertEqual(len(list(tpb.top())), 100)
+        self.assertEqual(tpb.transport.failovers, 2)
+
+    def test_failover_without_backoff(self):
+        broken = self.start(errors={'*': {503: 1.0}})
+        working = self.start()
+        tpb = TPB([broken, working], backoff=1)
+        start = time.time()
+        self.assertEqual(len(list(tpb.top())), 100)
+        # The next mirror is tried instead of retrying the failing one
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(tpb.transport.mirrors[0].requests, 1)
+
+    def test_all_failing(self):
+        tpb = TPB([self.start(errors={'top': {503: 1.0}}),
+                   self.start(errors={'top': {429: 1.0}})], retries=0)
+        self.assertRaises(BlockedError, list, tpb.top())
+
+    def test_fastest(self):
+        slow = self.start(latency={'*': constant(0.2)})
+        fast = self.start()
+        tpb = TPB([slow, fast])
+        for _ in range(3):
+            list(tpb.top())
+        self.assertEqual(tpb.transport.ranking()[0].url, fast)
+        self.assertEqual(tpb.transport.mirrors[0].requests, 1)
+
+    def test_hedging(self):
+        slow = self.start(latency={'*': constant(2)})
+        fast = self.start()
+        tpb = TPB([slow, fast], hedge_after=0.1)
+        start = time.time()
+        self.assertEqual(len(list(tpb.top())), 100)
+        self.assertLess(time.time() - start, 1.5)
+        self.assertEqual(tpb.transport.hedges, 1)
+        tpb.close()
+
+    def test_concurrent_hedging(self):
+        mirrors = [self.start(latency={'*': constant(0.2)}) for _ in range(2)]
+        tpb = TPB(mirrors, hedge_after=0.5)
+        torrents = list(tpb.top())[:30]
+        start = time.time()
+        hydrated = list(tpb.hydrate(torrents, files=False, concurrency=16))
+        self.assertEqual([e for _, e in hydrated], [None] * 30)
+        # Requests waiting for a thread are not hedged
+        self.assertLess(time.time() - start, 1.5)
+        self.assertEqual(tpb.transport.hedges, 0)
+        tpb.close()
+
 
 def load_tests(loader, tests, discovery):
     for attr, envvar in [('_do_local', 'LOCAL'), ('_do_remote', 'REMOTE')]:
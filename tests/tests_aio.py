@@ -0,0 +1,57 @@
+import asyncio
+import unittest
+
+from tests.cases import RemoteTestCase
+
+try:
+    from tpb.aio import AsyncTPB, AsyncSearch, AsyncTorrent
+except ImportError:
+    AsyncTPB = None
+
+
+@unittest.skipIf(AsyncTPB is None, 'aiohttp is not installed')
+class AsyncTPBTestCase(RemoteTestCase):
+
+    def run_async(self, coroutine):
+        return asyncio.run(coroutine)
+
+    def test_search(self):
+        async def search():
+            async with AsyncTPB(self.url) as tpb:
+                return [t async for t in tpb.search('tpb afk')]
+        torrents = self.run_async(search())
+        self.assertEqual(len(torrents), 30)
+        self.assertTrue(all(isinstance(t, AsyncTorrent) for t in torrents))
+
+    def test_multipage(self):
+        async def search():
+            items = []
+            async with AsyncTPB(self.url) as tpb:
+                search = tpb.search('tpb afk', multipage=True)
+                async for torrent in search:
+                    items.append(torrent)
+                    if len(items) == 50:
+                        break
+            return items, search.page()
+        items, page = self.run_async(search())
+        self.assertEqual(len(items), 50)
+        self.assertEqual(page, 1)
+
+    def test_top_and_recent_urls(self):
+        tpb = AsyncTPB(self.url)
+        self.assertEqual(str(tpb.top(100).url), self.url + '/top/100')
+        self.assertEqual(str(tpb.recent(3).url), self.url + '/recent/3')
+
+    def test_torrent_details(self):
+        async def details():
+            async with AsyncTPB(self.url) as tpb:
+                torrent = await tpb.search('tpb afk').items().__anext__()
+                return await torrent.info, await torrent.files
+        info, files = self.run_async(details())
+        self.assertNotEqual('', info.strip())
+        self.assertTrue(len(files) > 0)
+
+    def test_standalone(self):
+        async def search():
+            return [t async for t in AsyncSearch(self.url, 'tpb afk')]
+        self.assertEqual(len(self.run_async(search())), 30)
@@ -32,9 +32,55 @@ SOFTWARE.
 """
 import sys
 
-if sys.version_info >= (3, 0):
+# Public names and the modules they are lazily imported from
+_exports = {
+    'TPB': 'tpb.tpb',
+    'Cache': 'tpb.cache',
+    'to_columns': 'tpb.columns',
+    'Store': 'tpb.store',
+    'Stats': 'tpb.stats',
+    'ORDERS': 'tpb.constants',
+    'CATEGORIES': 'tpb.constants',
+}
+__all__ = list(_exports)
+
+if sys.version_info >= (3, 7):
+    import importlib
+
+    def __getattr__(name):
+        """
+        Import public names and submodules on first access so ``import tpb``
+        stays cheap.
+        """
+        if name not in _exports:
+            try:
+                return importlib.import_module('tpb.' + name)
+            except ImportError as e:
+                # Only a missing submodule, not a failing import within it
+                if e.name != 'tpb.' + name:
+                    raise
+            raise AttributeError(
+                "module 'tpb' has no attribute '{0}'".format(name))
+        value = getattr(importlib.import_module(_exports[name]), name)
+        globals()[name] = value
+        return value
+
+    def __dir__():
+        import pkgutil
+        submodules = set(name for _, name, _
+                         in pkgutil.iter_modules(__path__))
+        return sorted(set(globals()) | set(_exports) | submodules)
+elif sys.version_info >= (3, 0):
     from tpb.tpb import TPB
+    from tpb.cache import Cache
+    from tpb.columns import to_columns
+    from tpb.store import Store
+    from tpb.stats import Stats
     from tpb.constants import ORDERS, CATEGORIES
 else:
     from tpb import TPB
+    from cache import Cache
+    from columns import to_columns
+    from store import Store
+    from stats import Stats
     from constants import ORDERS, CATEGORIES
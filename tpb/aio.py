@@ -0,0 +1,239 @@
+"""
+Asyncio counterpart of the TPB API, built on ``aiohttp``. Requires Python 3.6+
+and the ``async`` extra (``pip install ThePirateBay[async]``).
+
+Lists are iterated with ``async for`` and torrent details are awaited::
+
+    async with AsyncTPB('https://thepiratebay.org') as t:
+        async for torrent in t.search('public domain').multipage():
+            print(await torrent.info)
+"""
+
+import aiohttp
+
+from .tpb import BLOCKED_STATUSES, Recent, Search, Top, Torrent
+from .transport import BlockedError, Transport
+
+
+class AsyncTransport(object):
+
+    """
+    Keep-alive asyncio HTTP transport backed by an ``aiohttp.ClientSession``.
+    The session is created lazily so it is bound to the running event loop.
+    """
+
+    headers = Transport.headers
+
+    def __init__(self, headers=None, timeout=30, pool_size=10, limit=100):
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.limit = limit
+        self._headers = dict(self.headers)
+        if headers is not None:
+            self._headers.update(headers)
+        self.session = None
+
+    def _session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit,
+                                             limit_per_host=self.pool_size)
+            self.session = aiohttp.ClientSession(
+                connector=connector, headers=self._headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    async def text(self, url):
+        """
+        Request the given URL and return the decoded response body. Raises
+        ``BlockedError`` if the mirror refused to serve it and
+        ``aiohttp.ClientResponseError`` for other error statuses, like
+        ``get``.
+        """
+        async with self._session().get(str(url)) as response:
+            if response.status in BLOCKED_STATUSES:
+                raise BlockedError(str(url), response.status)
+            response.raise_for_status()
+            return await response.text()
+
+    async def close(self):
+        """
+        Close every pooled connection.
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+async def fetch(url, transport=None):
+    """
+    Request the URL through the given transport, or through a short-lived one
+    if none is given.
+    """
+    if transport is None:
+        async with AsyncTransport() as transport:
+            return await transport.text(url)
+    return await transport.text(url)
+
+
+class AsyncList(object):
+
+    """
+    Mixin turning a ``List`` into an asynchronous iterable. Row parsing is
+    inherited from the synchronous list.
+    """
+
+    async def items(self):
+        """
+        Request URL and parse response. Yield an ``AsyncTorrent`` for every
+        torrent on page.
+        """
+        if self._limit == 0:
+            return
+        text = await fetch(self.url, self.transport)
+        self._rows = 0
+        for count, item in enumerate(self._parse(text), 1):
+            yield item
+            if count == self._limit:
+                return
+
+    def __aiter__(self):
+        return self.items()
+
+    def _torrent(self, *args, **kwargs):
+        return AsyncTorrent(*args, **kwargs)
+
+
+class AsyncPaginated(AsyncList):
+
+    """
+    Asynchronous pagination on top of ``AsyncList``. In multipage mode
+    torrents from next pages are automatically chained.
+    """
+
+    async def items(self):
+        if not self._multipage:
+            async for item in super(AsyncPaginated, self).items():
+                yield item
+            return
+        count = 0
+        while count != self._limit:
+            empty = True
+            async for item in super(AsyncPaginated, self).items():
+                empty = False
+                count += 1
+                yield item
+                if count == self._limit:
+                    return
+            # Stop if no more torrents, filtered out or not
+            if empty and not self._rows:
+                return
+            self.next()
+
+
+class AsyncSearch(AsyncPaginated, Search):
+
+    """
+    Asynchronous paginated search.
+    """
+
+
+class AsyncRecent(AsyncPaginated, Recent):
+
+    """
+    Asynchronous paginated most recent torrents.
+    """
+
+
+class AsyncTop(AsyncList, Top):
+
+    """
+    Asynchronous top torrents.
+    """
+
+
+class AsyncTorrent(Torrent):
+
+    """
+    Torrent whose ``info`` and ``files`` have to be awaited.
+    """
+
+    __slots__ = []
+
+    @property
+    def info(self):
+        return self._fetch_info()
+
+    @property
+    def files(self):
+        return self._fetch_files()
+
+    async def _fetch_info(self):
+        if self._info is None:
+            text = await fetch(self.url, self.transport)
+            self._info = self._parse_info(text)
+        return self._info
+
+    async def _fetch_files(self):
+        if not self._files:
+            text = await fetch(self._files_url(), self.transport)
+            self._files = self._parse_files(text)
+        return self._files
+
+
+class AsyncTPB(object):
+
+    """
+    Asyncio TPB API sharing one pooled ``AsyncTransport`` between all the
+    searches, recent and top lists it creates. Extra keyword arguments
+    configure the transport unless one is given.
+    """
+
+    def __init__(self, base_url, transport=None, **kwargs):
+        self.base_url = base_url
+        if transport is None:
+            transport = AsyncTransport(**kwargs)
+        self.transport = transport
+
+    def _bind(self, torrents):
+        torrents.transport = self.transport
+        return torrents
+
+    def search(self, query, page=0, order=7, category=0, multipage=False):
+        """
+        Asynchronous counterpart of ``TPB.search``.
+        """
+        search = self._bind(AsyncSearch(self.base_url, query, page, order,
+                                        category))
+        if multipage:
+            search.multipage()
+        return search
+
+    def recent(self, page=0):
+        """
+        Asynchronous counterpart of ``TPB.recent``.
+        """
+        return self._bind(AsyncRecent(self.base_url, page))
+
+    def top(self, category=0):
+        """
+        Asynchronous counterpart of ``TPB.top``.
+        """
+        return self._bind(AsyncTop(self.base_url, category))
+
+    async def close(self):
+        """
+        Close the pooled connections of this instance.
+        """
+        await self.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -0,0 +1,93 @@
+"""
+In-memory response cache for parsed TPB pages.
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class Cache(object):
+
+    """
+    Thread safe LRU cache with per endpoint time to live. Entries are keyed by
+    URL and hold already parsed results (lists of torrents, torrent infos and
+    files), so hits skip both the request and the parsing. Eviction is bounded
+    by the number of entries and by the size in bytes of the pages the entries
+    were parsed from.
+    """
+
+    # Seconds each endpoint stays fresh
+    ttls = {
+        '/recent': 60,
+        '/search': 5 * 60,
+        '/top': 15 * 60,
+        '/torrent': 24 * 60 * 60,
+    }
+    default_ttl = 5 * 60
+
+    def __init__(self, ttls=None, max_entries=1024, max_bytes=64 * 2 ** 20,
+                 clock=time.time):
+        self.ttls = dict(self.ttls)
+        if ttls is not None:
+            self.ttls.update(ttls)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key: (value, expiration, size)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the fresh value cached for key, None otherwise.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[1] <= self.clock():
+                if entry is not None:
+                    self.size -= entry[2]
+                self.misses += 1
+                return None
+            # Reinsert to mark as most recently used
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, endpoint=None, size=0):
+        """
+        Cache value for key with the time to live of the given endpoint. The
+        size in bytes is only used for eviction.
+        """
+        ttl = self.ttls.get(endpoint, self.default_ttl)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[2]
+            self._entries[key] = (value, self.clock() + ttl, size)
+            self.size += size
+            # Evict least recently used entries until within bounds
+            while self._entries and (len(self._entries) > self.max_entries or
+                                     self.size > self.max_bytes):
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Drop every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[1] > self.clock()
+
+    def __len__(self):
+        return len(self._entries)
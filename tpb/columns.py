@@ -0,0 +1,62 @@
+"""
+Columnar export of torrents for vectorized filtering and sorting.
+"""
+
+from array import array
+
+try:
+    array('q')
+    INTEGER = 'q'
+except ValueError:
+    # Python 2 arrays have no long long typecode
+    INTEGER = 'l'
+
+
+# Column name, array typecode and value getter of every numeric column
+NUMERIC = [
+    ('id', INTEGER, lambda t: int(t.id) if t.id.isdigit() else -1),
+    ('seeders', INTEGER, lambda t: t.seeders),
+    ('leechers', INTEGER, lambda t: t.leechers),
+    ('comments', INTEGER, lambda t: t.comments),
+    ('size_bytes', INTEGER,
+     lambda t: -1 if t.size_bytes is None else t.size_bytes),
+    ('timestamp', 'd', lambda t: t.timestamp),
+    ('ratio', 'd', lambda t: t.ratio),
+]
+
+# Column name and value getter of every text column
+TEXT = [
+    ('title', lambda t: t.title),
+    ('category', lambda t: t.category),
+    ('sub_category', lambda t: t.sub_category),
+    ('user', lambda t: t.user),
+    ('user_status', lambda t: t.user_status),
+]
+
+
+def to_columns(torrents, use_numpy=None):
+    """
+    Returns a dictionary mapping column names to the values of the given
+    torrents, in order. Numeric columns are NumPy arrays if NumPy is available
+    (or ``array.array`` otherwise, or if use_numpy is False), text columns are
+    NumPy object arrays or lists. Unknown sizes and non numeric ids are -1.
+    """
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    torrents = list(torrents)
+    columns = {}
+    for name, typecode, value in NUMERIC:
+        values = array(typecode, [value(t) for t in torrents])
+        if use_numpy:
+            values = numpy.frombuffer(values, dtype=typecode).copy()
+        columns[name] = values
+    for name, value in TEXT:
+        values = [value(t) for t in torrents]
+        if use_numpy:
+            values = numpy.array(values, dtype=object)
+        columns[name] = values
+    return columns
@@ -0,0 +1,378 @@
+"""
+Crawl coordination through a shared queue of listing pages, so several
+workers on one or many machines can drain the same crawl.
+"""
+
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+
+class WorkUnit(object):
+
+    """
+    One listing page to crawl: a search page (query, category, order, page),
+    a recent torrents page or a top list. Units marked expand enqueue the
+    other pages counted from their pagination links once crawled.
+    """
+
+    __slots__ = ['kind', 'query', 'category', 'order', 'page', 'expand',
+                 'id', 'attempts']
+
+    def __init__(self, kind, query='', category=0, order=7, page=0,
+                 expand=False, id=None, attempts=0):
+        self.kind = kind  # 'search', 'recent' or 'top'
+        self.query = query
+        self.category = category
+        self.order = order
+        self.page = page
+        self.expand = expand
+        self.id = id  # identifier in the queue
+        self.attempts = attempts  # times the unit was claimed
+
+    @property
+    def key(self):
+        """
+        Identity of the page, a queue holds a single unit by key.
+        """
+        return (self.kind, self.query, self.category, self.order, self.page)
+
+    def listing(self, tpb):
+        """
+        Returns the list of torrents of this unit built by the given ``TPB``.
+        """
+        if self.kind == 'search':
+            return tpb.search(self.query, self.page, self.order,
+                              self.category)
+        if self.kind == 'recent':
+            return tpb.recent(self.page)
+        return tpb.top(self.category)
+
+    def pages(self, count):
+        """
+        Returns the units of the pages following this one, up to count.
+        """
+        return [WorkUnit(self.kind, self.query, self.category, self.order,
+                         page)
+                for page in range(self.page + 1, count)]
+
+    def __repr__(self):
+        return '<WorkUnit {0} {1!r} category={2} order={3} page={4}>'.format(
+            self.kind, self.query, self.category, self.order, self.page)
+
+
+class SQLiteQueue(object):
+
+    """
+    Work queue in a SQLite database, shared by the workers of one machine or
+    of several ones through a network file system with working locks. Units
+    are claimed atomically in an immediate transaction and leased to a worker
+    for some seconds: units of workers which died are claimed again once
+    their lease expired.
+
+    Other backends (Redis, a SQL server...) only need the same methods with
+    atomic claims.
+    """
+
+    fields = ['id', 'kind', 'query', 'category', '"order"', 'page', 'expand',
+              'attempts']
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS units (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            query TEXT NOT NULL,
+            category INTEGER NOT NULL,
+            "order" INTEGER NOT NULL,
+            page INTEGER NOT NULL,
+            expand INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            worker TEXT,
+            lease_until REAL,
+            available REAL NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            updated REAL,
+            UNIQUE (kind, query, category, "order", page)
+        );
+        CREATE INDEX IF NOT EXISTS units_status ON units (status, available);
+    """
+
+    def __init__(self, path=':memory:', timeout=30, clock=time.time):
+        self.path = path
+        self.clock = clock
+        # Transactions are explicit so claims can lock the database first
+        self._connection = sqlite3.connect(
+            path, timeout=timeout, isolation_level=None,
+            check_same_thread=False)
+        self._connection.executescript(self.schema)
+        self._lock = threading.Lock()
+
+    def _transaction(self, statements):
+        """
+        Run statements(cursor) in an immediate transaction, returning its
+        result.
+        """
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                result = statements(cursor)
+            except Exception:
+                cursor.execute('ROLLBACK')
+                raise
+            cursor.execute('COMMIT')
+            return result
+
+    def add(self, units):
+        """
+        Enqueue the given units, ignoring the ones already queued whatever
+        their status. Returns how many were added.
+        """
+        rows = [(u.kind, u.query, int(u.category), int(u.order), u.page,
+                 int(u.expand), self.clock()) for u in units]
+
+        def insert(cursor):
+            before = self._connection.total_changes
+            cursor.executemany(
+                'INSERT OR IGNORE INTO units (kind, query, category, '
+                '"order", page, expand, updated) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows)
+            return self._connection.total_changes - before
+        return self._transaction(insert)
+
+    def claim(self, worker, lease=60):
+        """
+        Lease the next unit to worker for lease seconds and return it, None
+        if there is nothing to do for now. A worker restarted under the same
+        name first gets back the unit it was leased, which counts as another
+        attempt as the previous one died on it.
+        """
+        now = self.clock()
+        columns = ', '.join(self.fields)
+
+        def select(cursor):
+            row = cursor.execute(
+                'SELECT {0} FROM units WHERE status = ? AND worker = ? '
+                'ORDER BY id LIMIT 1'.format(columns),
+                ('leased', worker)).fetchone()
+            if row is None:
+                row = cursor.execute(
+                    'SELECT {0} FROM units WHERE (status = ? AND '
+                    'available <= ?) OR (status = ? AND lease_until <= ?) '
+                    'ORDER BY id LIMIT 1'.format(columns),
+                    ('pending', now, 'leased', now)).fetchone()
+            if row is None:
+                return None
+            cursor.execute(
+                'UPDATE units SET status = ?, worker = ?, lease_until = ?, '
+                'attempts = attempts + 1, updated = ? WHERE id = ?',
+                ('leased', worker, now + lease, now, row[0]))
+            return row[:-1] + (row[-1] + 1,)
+        row = self._transaction(select)
+        if row is None:
+            return None
+        id, kind, query, category, order, page, expand, attempts = row
+        return WorkUnit(kind, query, category, order, page, bool(expand), id,
+                        attempts)
+
+    def _update(self, unit, worker, assignments, parameters):
+        """
+        Update the unit if it is still leased to worker, returns whether it
+        was.
+        """
+        def update(cursor):
+            cursor.execute(
+                'UPDATE units SET {0}, updated = ? WHERE id = ? AND '
+                'status = ? AND worker = ?'.format(assignments),
+                tuple(parameters) + (self.clock(), unit.id, 'leased',
+                                     worker))
+            return cursor.rowcount == 1
+        return self._transaction(update)
+
+    def extend(self, unit, worker, lease=60):
+        """
+        Renew the lease of worker on unit, returns False if it was lost.
+        """
+        return self._update(unit, worker, 'lease_until = ?',
+                            [self.clock() + lease])
+
+    def complete(self, unit, worker):
+        """
+        Checkpoint unit as done, it will never be claimed again.
+        """
+        return self._update(unit, worker, 'status = ?, worker = NULL',
+                            ['done'])
+
+    def retry(self, unit, worker, error, delay=0):
+        """
+        Put unit back in the queue, claimable again in delay seconds.
+        """
+        return self._update(
+            unit, worker, 'status = ?, worker = NULL, available = ?, '
+            'error = ?', ['pending', self.clock() + delay, error])
+
+    def fail(self, unit, worker, error):
+        """
+        Give up on unit.
+        """
+        return self._update(unit, worker, 'status = ?, worker = NULL, '
+                            'error = ?', ['failed', error])
+
+    def counts(self):
+        """
+        Returns the number of units by status.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT status, COUNT(*) FROM units GROUP BY status')
+            return dict(rows.fetchall())
+
+    def errors(self):
+        """
+        Returns the failed units and their last error.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT {0}, error FROM units WHERE status = ? '
+                'ORDER BY id'.format(', '.join(self.fields)),
+                ('failed',)).fetchall()
+        return [(WorkUnit(kind, query, category, order, page, bool(expand),
+                          id, attempts), error)
+                for id, kind, query, category, order, page, expand, attempts,
+                error in rows]
+
+    def close(self):
+        """
+        Close the underlying database connection.
+        """
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Coordinator(object):
+
+    """
+    Fill a work queue with the pages of searches, recent torrents and top
+    lists. Pages not given are counted by the worker crawling the first one,
+    from its pagination links.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def search(self, query, category=0, order=7, pages=None):
+        """
+        Enqueue the given number of pages of a search, all of them if None.
+        """
+        return self._paginated(WorkUnit('search', query, int(category),
+                                        int(order)), pages)
+
+    def recent(self, pages=None):
+        """
+        Enqueue the given number of pages of recent torrents, all of them if
+        None.
+        """
+        return self._paginated(WorkUnit('recent'), pages)
+
+    def top(self, category=0):
+        """
+        Enqueue the top torrents of category.
+        """
+        return self.queue.add([WorkUnit('top', category=int(category))])
+
+    def _paginated(self, first, pages):
+        if pages is None:
+            first.expand = True
+            return self.queue.add([first])
+        return self.queue.add([first] + first.pages(pages))
+
+    def progress(self):
+        """
+        Returns the number of units by status.
+        """
+        return self.queue.counts()
+
+
+class Worker(object):
+
+    """
+    Drain a work queue with a ``TPB``, passing the torrents of every claimed
+    page to a handler before checkpointing the page as done (torrents are
+    also saved by the ``TPB`` store, if any). Pages that failed are retried
+    with an exponential backoff up to max_attempts times, a page claimed more
+    often (its workers kept dying on it) is given up.
+
+    Workers need a name unique in the crawl, stable across restarts so a
+    restarted worker resumes its leased page instead of waiting for the lease
+    to expire.
+    """
+
+    def __init__(self, queue, tpb, name=None, lease=60, max_attempts=3,
+                 backoff=5, sleep=time.sleep):
+        self.queue = queue
+        self.tpb = tpb
+        if name is None:
+            name = '{0}-{1}'.format(socket.gethostname(), os.getpid())
+        self.name = name
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.sleep = sleep
+
+    def run(self, handle=None, max_units=None, poll=None):
+        """
+        Crawl claimed pages until the queue has nothing left to claim, or
+        max_units pages were done. If poll is given, wait that many seconds
+        between claims while other workers still hold leases or pages wait
+        to be retried. handle(unit, torrents) is called for every page.
+        Returns the number of pages done.
+        """
+        done = 0
+        while max_units is None or done < max_units:
+            unit = self.queue.claim(self.name, self.lease)
+            if unit is None:
+                counts = self.queue.counts()
+                if poll is None or not (counts.get('pending') or
+                                        counts.get('leased')):
+                    return done
+                self.sleep(poll)
+                continue
+            if self.process(unit, handle):
+                done += 1
+        return done
+
+    def process(self, unit, handle=None):
+        """
+        Crawl the claimed unit, returns whether it is done. Units whose lease
+        was lost meanwhile are left to the worker which claimed them again.
+        """
+        if unit.attempts > self.max_attempts:
+            self.queue.fail(unit, self.name, 'Lease expired too many times')
+            return False
+        try:
+            listing = unit.listing(self.tpb)
+            torrents = list(listing)
+            # Fetching may have taken most of the lease
+            if not self.queue.extend(unit, self.name, self.lease):
+                return False
+            if unit.expand:
+                self.queue.add(unit.pages(listing.page_count()))
+            if handle is not None:
+                handle(unit, torrents)
+        except Exception as e:
+            error = '{0}: {1}'.format(type(e).__name__, e)
+            if unit.attempts >= self.max_attempts:
+                self.queue.fail(unit, self.name, error)
+            else:
+                self.queue.retry(unit, self.name, error,
+                                 self.backoff * 2 ** (unit.attempts - 1))
+            return False
+        return self.queue.complete(unit, self.name)
@@ -0,0 +1,105 @@
+"""
+Bounded memory structures remembering the torrents already seen.
+"""
+
+from collections import OrderedDict
+import hashlib
+import math
+import re
+
+
+_infohash = re.compile(r'btih:([^&]+)', re.IGNORECASE)
+
+
+def torrent_id(torrent):
+    """
+    Returns the TPB id of torrent.
+    """
+    return torrent.id
+
+
+def infohash(torrent):
+    """
+    Returns the infohash of torrent from its magnet link, its TPB id if it
+    has none.
+    """
+    match = _infohash.search(torrent.magnet_link or '')
+    if match is None:
+        return torrent.id
+    return match.group(1).lower()
+
+
+class SeenSet(object):
+
+    """
+    Exact set of keys holding at most capacity of them. Once full the oldest
+    key is forgotten, which is fine for shifting result pages where
+    duplicates are always recent.
+    """
+
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self._keys = OrderedDict()
+
+    def add(self, key):
+        """
+        Add key, returns False if it was already there.
+        """
+        if key in self._keys:
+            return False
+        self._keys[key] = None
+        if len(self._keys) > self.capacity:
+            self._keys.popitem(last=False)
+        return True
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class BloomFilter(object):
+
+    """
+    Probabilistic set using a fixed number of bits for capacity keys at the
+    given false positive rate, a false positive dropping a torrent never
+    seen. The rate grows past capacity.
+    """
+
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bits = max(8, int(-capacity * math.log(error_rate) /
+                               math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.bits / float(capacity) *
+                                       math.log(2))))
+        self._array = bytearray((self.bits + 7) // 8)
+        self._count = 0
+
+    def _positions(self, key):
+        # Double hashing of a single digest
+        digest = hashlib.md5(key.encode('utf-8')).hexdigest()
+        first, second = int(digest[:16], 16), int(digest[16:], 16)
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def add(self, key):
+        """
+        Add key, returns False if it was probably already there.
+        """
+        new = False
+        for position in self._positions(key):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not self._array[byte] & mask:
+                self._array[byte] |= mask
+                new = True
+        if new:
+            self._count += 1
+        return new
+
+    def __contains__(self, key):
+        return all(self._array[p >> 3] & 1 << (p & 7)
+                   for p in self._positions(key))
+
+    def __len__(self):
+        return self._count
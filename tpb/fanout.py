@@ -0,0 +1,165 @@
+"""
+Concurrent fan-out of several paginated lists merged into one ranking.
+"""
+
+import heapq
+
+from .dedup import SeenSet
+
+
+# Torrent attribute each order sorts on and whether it is descending. TPB
+# sorts types by category number, which torrents do not keep: type orders
+# can't be merged
+ORDER_KEYS = {
+    1: ('title', True),
+    2: ('title', False),
+    3: ('timestamp', True),
+    4: ('timestamp', False),
+    5: ('size_bytes', True),
+    6: ('size_bytes', False),
+    7: ('seeders', True),
+    8: ('seeders', False),
+    9: ('leechers', True),
+    10: ('leechers', False),
+    11: ('user', True),
+    12: ('user', False),
+}
+
+
+class Descending(object):
+
+    """
+    Wrapper reversing the ordering of a value, so descending orders of non
+    numeric values fit in a min-heap.
+    """
+
+    __slots__ = ['value']
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __gt__(self, other):
+        return other.value > self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __ne__(self, other):
+        return self.value != other.value
+
+
+def order_key(order):
+    """
+    Returns a function giving the heap key of a torrent for the given
+    ``ORDERS`` value, smallest first. Raises ``ValueError`` for orders the
+    merge can't reproduce.
+    """
+    if int(order) not in ORDER_KEYS:
+        raise ValueError('Torrents can not be merged by order {0}'.format(
+            order))
+    name, descending = ORDER_KEYS[int(order)]
+
+    def key(torrent):
+        value = getattr(torrent, name)
+        if value is None:
+            value = -1 if name == 'size_bytes' else ''
+        if not descending:
+            return value
+        if isinstance(value, (int, float)):
+            return -value
+        return Descending(value)
+    return key
+
+
+class Source(object):
+
+    """
+    Pages of one paginated list, fetched in the background one page ahead
+    while more torrents than the current page holds may still be needed.
+    """
+
+    def __init__(self, index, torrents, executor):
+        self.index = index
+        self.torrents = torrents
+        self.executor = executor
+        self.number = torrents.page()
+        self.items = iter([])
+        self.exhausted = False
+        self.pending = None  # (number, url, future) of the next page
+
+    def fetch(self):
+        self.pending = ((self.number,) +
+                        self.torrents._submit_page(self.executor, self.number))
+        self.number += 1
+
+    def next(self, wanted=None):
+        """
+        Returns the next torrent, None once the list is exhausted. wanted is
+        how many more torrents the merge may still need, None if unlimited.
+        """
+        while True:
+            item = next(self.items, None)
+            if item is not None or self.exhausted:
+                return item
+            if self.pending is None:
+                self.fetch()
+            items = self.torrents._load_page(*self.pending)
+            self.pending = None
+            if not self.torrents._rows:
+                self.exhausted = True
+                return None
+            self.items = iter(items)
+            # Only fetch deeper pages that may be needed
+            if wanted is None or len(items) < wanted:
+                self.fetch()
+
+    def cancel(self):
+        if self.pending is not None and self.pending[2] is not None:
+            self.pending[2].cancel()
+
+
+def merge(lists, order, limit=None, concurrency=8, capacity=100000):
+    """
+    Yield the torrents of the given paginated lists, each sorted by the same
+    ``ORDERS`` value, as one sorted stream. Pages are fetched concurrently,
+    the lists merged lazily with a heap and torrents yielded once by id. No
+    deeper page is fetched once limit torrents were yielded.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    key = order_key(order)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    sources = [Source(i, torrents, executor)
+               for i, torrents in enumerate(lists)]
+    seen = SeenSet(capacity)
+    heap = []
+    count = sequence = 0
+    try:
+        # Request the first pages all at once
+        for source in sources:
+            source.fetch()
+        for source in sources:
+            item = source.next(limit)
+            if item is not None:
+                heap.append((key(item), source.index, sequence, item))
+                sequence += 1
+        heapq.heapify(heap)
+        while heap and limit != 0:
+            _, index, _, item = heapq.heappop(heap)
+            if seen.add(item.id):
+                count += 1
+                yield item
+                if count == limit:
+                    return
+            wanted = None if limit is None else limit - count
+            following = sources[index].next(wanted)
+            if following is not None:
+                heapq.heappush(heap, (key(following), index, sequence,
+                                      following))
+                sequence += 1
+    finally:
+        for source in sources:
+            source.cancel()
+        executor.shutdown(wait=False)
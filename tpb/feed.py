@@ -0,0 +1,79 @@
+"""
+Watermark of the torrents already ingested from the recent torrents feed.
+"""
+
+import json
+import os
+
+
+class Watermark(object):
+
+    """
+    Newest torrent id and upload timestamp already ingested. TPB ids grow
+    with uploads so torrents are compared by id, or by upload time if ids
+    are not numeric. Upload times only have a minute resolution: torrents
+    uploaded the same minute as the watermark count as already ingested.
+    """
+
+    def __init__(self, id=None, timestamp=None):
+        self.id = id
+        self.timestamp = timestamp
+
+    @property
+    def empty(self):
+        return self.id is None and self.timestamp is None
+
+    def covers(self, torrent):
+        """
+        Returns whether torrent is not newer than the watermark.
+        """
+        if self.id is not None and torrent.id.isdigit():
+            return int(torrent.id) <= self.id
+        if self.timestamp is not None:
+            return torrent.timestamp <= self.timestamp
+        return False
+
+    def advance(self, torrent):
+        """
+        Move the watermark up to torrent if it is newer.
+        """
+        if torrent.id.isdigit():
+            self.id = max(self.id or 0, int(torrent.id))
+        self.timestamp = max(self.timestamp or 0, torrent.timestamp)
+
+    def to_json(self):
+        return json.dumps({'id': self.id, 'timestamp': self.timestamp})
+
+    @classmethod
+    def from_json(cls, text):
+        return cls(**json.loads(text))
+
+    def save(self, path):
+        """
+        Atomically write the watermark to the file at path.
+        """
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as f:
+            f.write(self.to_json())
+        getattr(os, 'replace', os.rename)(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read the watermark saved at path, an empty one if there is none.
+        """
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            return cls.from_json(f.read())
+
+    def __eq__(self, other):
+        return (isinstance(other, Watermark) and
+                (self.id, self.timestamp) == (other.id, other.timestamp))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<Watermark id={0} timestamp={1}>'.format(self.id,
+                                                         self.timestamp)
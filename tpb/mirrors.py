@@ -0,0 +1,245 @@
+"""
+Transport spreading requests over several TPB mirrors.
+"""
+
+import threading
+import time
+
+from .transport import Transport
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+
+
+def origin(url):
+    """
+    Returns the scheme and location of url.
+    """
+    parts = urlsplit(str(url))
+    return '{0}://{1}'.format(parts.scheme, parts.netloc)
+
+
+class Mirror(object):
+
+    """
+    Health of a mirror: exponentially weighted moving averages of its
+    response time and of its error rate, and the time of its last error.
+    Only successful requests are timed so quickly failing mirrors do not
+    look fast.
+    """
+
+    def __init__(self, url):
+        self.url = origin(url)
+        self.latency = None
+        self.error_rate = 0.0
+        self.failed = None
+        self.requests = 0
+
+    def record(self, seconds, error, alpha, now):
+        self.requests += 1
+        self.error_rate += alpha * (float(error) - self.error_rate)
+        if error:
+            self.failed = now
+        elif self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += alpha * (seconds - self.latency)
+
+    def __repr__(self):
+        return '<Mirror {0} latency={1} error_rate={2:.2f}>'.format(
+            self.url, self.latency, self.error_rate)
+
+
+class MirrorTransport(Transport):
+
+    """
+    Transport sending every request to the fastest healthy mirror. Lists and
+    torrents keep building URLs on the first mirror, their origin is replaced
+    by the chosen mirror's one at request time.
+
+    Mirrors are healthy while their error rate stays below max_error_rate, or
+    again cooldown seconds after their last error. A request failing on a
+    mirror (connection error, timeout or retried status) fails over to the
+    next one right away, the other mirrors standing for the retries: only the
+    last mirror tried retries after a backoff. If hedge_after is given,
+    requests still running after that many seconds are duplicated to the next
+    mirror and the first successful response wins. Hedged requests run in
+    a pool of pool_size threads per mirror.
+    """
+
+    def __init__(self, mirrors, hedge_after=None, alpha=0.3,
+                 max_error_rate=0.5, cooldown=30, clock=time.time, **kwargs):
+        super(MirrorTransport, self).__init__(**kwargs)
+        if not mirrors:
+            raise ValueError('At least one mirror is required')
+        self.mirrors = [Mirror(url) for url in mirrors]
+        self.hedge_after = hedge_after
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self.clock = clock
+        self.failovers = 0
+        self.hedges = 0
+        self._origins = set(mirror.url for mirror in self.mirrors)
+        self._executor = None
+        self._health_lock = threading.Lock()
+
+    def ranking(self):
+        """
+        Returns the mirrors to try in order: healthy ones fastest first, never
+        measured ones before any other, then unhealthy ones least failing
+        first.
+        """
+        now = self.clock()
+        with self._health_lock:
+            healthy, unhealthy = [], []
+            for mirror in self.mirrors:
+                if (mirror.error_rate < self.max_error_rate or
+                        mirror.failed is None or
+                        now - mirror.failed >= self.cooldown):
+                    healthy.append(mirror)
+                else:
+                    unhealthy.append(mirror)
+            healthy.sort(key=lambda m: m.latency or 0)
+            unhealthy.sort(key=lambda m: m.error_rate)
+        return healthy + unhealthy
+
+    def get(self, url, **kwargs):
+        """
+        Request the given URL on the best mirrors until one succeeds. Returns
+        the last response or raises the last error if they all failed.
+        """
+        url = str(url)
+        mirrors = self.ranking()
+        path = url
+        if origin(url) in self._origins:
+            path = url[len(origin(url)):]
+        else:
+            # Not a mirror URL, request it as is
+            mirrors = [None]
+        error = response = None
+        while mirrors:
+            if self.hedge_after is not None and len(mirrors) > 1:
+                done, response, error = self._hedged(mirrors, path, kwargs)
+                mirrors = [m for m in mirrors if m not in done]
+            else:
+                mirror = mirrors.pop(0)
+                response, error = self._attempt(mirror, path, kwargs,
+                                                not mirrors)
+            if error is None and not self._failed(response):
+                return response
+            if mirrors:
+                self.failovers += 1
+                if response is not None:
+                    response.close()
+        if error is not None:
+            raise error
+        return response
+
+    def _failed(self, response):
+        return response.status_code in self.retry_statuses or \
+            response.status_code == 403
+
+    def _attempt(self, mirror, path, kwargs, last=True):
+        """
+        Request path on mirror, recording its latency and outcome. Only the
+        last mirror to try retries transient failures. Returns a (response,
+        error) tuple.
+        """
+        if mirror is None:
+            url = path
+        else:
+            url = mirror.url + path
+        start = self.clock()
+        response = error = None
+        try:
+            response = self._get(url, self.retries if last else 0,
+                                 **kwargs)
+        except Exception as e:
+            error = e
+        if mirror is not None:
+            failed = error is not None or self._failed(response)
+            now = self.clock()
+            with self._health_lock:
+                mirror.record(now - start, failed, self.alpha, now)
+        return response, error
+
+    def _hedged(self, mirrors, path, kwargs):
+        """
+        Request path on the first mirror, then on the next ones every
+        hedge_after seconds until a request succeeds. The delay counts from
+        when the last request actually started, not from when it was queued.
+        Returns the mirrors tried and the (response, error) of the winning
+        request, or of the last one to fail.
+        """
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    from concurrent.futures import ThreadPoolExecutor
+                    # Up to one request per pooled connection to every mirror
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.pool_size * len(self.mirrors))
+        changed = threading.Condition()
+
+        def attempt(mirror, started, last):
+            with changed:
+                started.append(time.time())
+                changed.notify()
+            return self._attempt(mirror, path, kwargs, last)
+
+        def notify(future):
+            with changed:
+                changed.notify()
+
+        pending = {}
+        tried = []
+        started = None  # start time of the last request once it started
+        response = error = None
+        with changed:
+            while True:
+                for future in [f for f in pending if f.done()]:
+                    del pending[future]
+                    response, error = future.result()
+                    if error is None and not self._failed(response):
+                        # Close the responses of the losing requests
+                        for other in pending:
+                            other.add_done_callback(_close)
+                        return tried, response, error
+                    if pending or len(tried) < len(mirrors):
+                        self.failovers += 1
+                        if response is not None:
+                            response.close()
+                timeout = None
+                if len(tried) < len(mirrors):
+                    if pending and started:
+                        timeout = started[0] + self.hedge_after - time.time()
+                    if not pending or (timeout is not None and
+                                       timeout <= 0):
+                        if pending:
+                            self.hedges += 1
+                        mirror = mirrors[len(tried)]
+                        tried.append(mirror)
+                        started = []
+                        future = self._executor.submit(
+                            attempt, mirror, started,
+                            len(tried) == len(mirrors))
+                        future.add_done_callback(notify)
+                        pending[future] = mirror
+                        continue
+                elif not pending:
+                    return tried, response, error
+                changed.wait(timeout)
+
+    def close(self):
+        super(MirrorTransport, self).close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+def _close(future):
+    response, _ = future.result()
+    if response is not None:
+        response.close()
@@ -0,0 +1,138 @@
+"""
+Crawl pipeline downloading listing pages in threads and parsing them in
+processes, so parsing is not bound to the single core the GIL allows.
+"""
+
+from collections import OrderedDict
+from copy import copy
+
+from .stats import timer
+from .tpb import List, get, share
+
+
+class PageParser(List):
+
+    """
+    Listing parser of the worker processes, knowing only the URL of the page
+    and the origin torrent paths are joined to rather than a whole list.
+    """
+
+    def __init__(self, url, origin, where=None):
+        self.url = url
+        self.origin = origin
+        self._where = where
+
+    def _origin(self):
+        return self.origin
+
+
+def parse_page(url, origin, content, encoding, where=None):
+    """
+    Parse the raw content of the listing page at url, in a worker process.
+    Returns its torrents, its number of rows and the page count of its
+    pagination. Torrents are pickled back as compact tuples of their fields.
+    """
+    parser = PageParser(url, origin, where)
+    items = parser._parse(content.decode(encoding or 'utf-8', 'replace'))
+    return items, parser._rows, parser._pages[1]
+
+
+def crawl(torrents, processes=None, concurrency=8, ordered=True,
+          backlog=None, executor=None):
+    """
+    Yield the torrents of every page of the paginated list torrents from its
+    current page on, the pages being counted from the pagination links like
+    in ``Paginated.parallel``.
+
+    Up to concurrency pages are downloaded at once by threads, their raw
+    content is parsed by a pool of processes (processes of them, one per core
+    by default, or the given ``ProcessPoolExecutor``). At most backlog pages
+    (twice concurrency by default) are requested but not consumed yet, so a
+    slow consumer holds back the downloads. Pages are yielded in order, or as
+    soon as they are parsed if not ordered.
+    """
+    from concurrent.futures import (FIRST_COMPLETED, Future,
+                                    ProcessPoolExecutor, ThreadPoolExecutor,
+                                    wait)
+    if backlog is None:
+        backlog = 2 * concurrency
+    parsers = executor
+    if parsers is None:
+        parsers = ProcessPoolExecutor(processes)
+    fetchers = ThreadPoolExecutor(max_workers=concurrency)
+    # Predicates are usually lambdas, which do not pickle: the workers only
+    # check the row criteria
+    where = predicate = None
+    if torrents._where is not None:
+        where = copy(torrents._where)
+        where.predicate, predicate = None, where.predicate
+    origin = torrents._origin()
+    cache = torrents._page_cache
+
+    def fetch(url):
+        watch = timer(torrents.stats, 'page', url)
+        response = get(url, torrents.transport)
+        watch.lap('fetch')
+        content = response.content
+        watch.count('bytes', len(content))
+        items, rows, pages = parsers.submit(
+            parse_page, url, origin, content, response.encoding,
+            where).result()
+        watch.count('rows', len(items))
+        watch.stop()
+        return items, rows, pages, len(content)
+
+    def submit(number):
+        url = torrents._page_url(number)
+        entry = None if cache is None else cache.get(url)
+        # Streamed pages are cached without their page count
+        if entry is None or entry[2] is None:
+            return fetchers.submit(fetch, url)
+        future = Future()
+        future.set_result(entry + (None,))
+        return future
+
+    def load(number, future):
+        items, rows, pages, size = future.result()
+        for item in items:
+            share(torrents, item, unset=True)
+        if size is not None:
+            if cache is not None:
+                cache.set(torrents._page_url(number), (items, rows, pages),
+                          torrents.base_path, size)
+            if torrents.store is not None:
+                torrents.store.upsert(items)
+        if predicate is not None:
+            items = [item for item in items if predicate(item)]
+        # Keep the list on the page being yielded, like multipage mode
+        torrents.page(number)
+        torrents._rows = rows
+        return items, rows, pages
+
+    pending = OrderedDict()  # future by page number
+    try:
+        ahead = count = torrents.page()
+        pending[ahead] = submit(ahead)
+        ahead += 1
+        while pending:
+            if ordered:
+                number = next(iter(pending))
+            else:
+                wait(list(pending.values()), return_when=FIRST_COMPLETED)
+                number = next(n for n, f in pending.items() if f.done())
+            items, rows, pages = load(number, pending.pop(number))
+            if ordered and not rows:
+                return
+            count = max(count, pages)
+            # Request the next pages before yielding, within the backlog
+            while ahead < count and len(pending) < backlog:
+                pending[ahead] = submit(ahead)
+                ahead += 1
+            for item in items:
+                yield item
+    finally:
+        for future in pending.values():
+            future.cancel()
+        fetchers.shutdown(wait=False)
+        if executor is None:
+            parsers.shutdown()
@@ -0,0 +1,234 @@
+"""
+Instrumentation of page loads and torrent details requests.
+"""
+
+from collections import Counter
+import threading
+import time
+
+# Monotonic high resolution clock where available
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class Histogram(object):
+
+    """
+    Cumulative histogram of observed values with fixed bucket upper bounds,
+    in the Prometheus fashion. Also tracks the count, sum, min and max.
+    """
+
+    # Exponential bounds in seconds, from half a millisecond to about 16s
+    bounds = [0.0005 * 2 ** i for i in range(16)]
+
+    def __init__(self, bounds=None):
+        if bounds is not None:
+            self.bounds = sorted(bounds)
+        self.buckets = [0] * (len(self.bounds) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        for index, bound in enumerate(self.bounds):
+            if value <= bound:
+                break
+        else:
+            index = len(self.bounds)
+        self.buckets[index] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, fraction):
+        """
+        Estimate the value below which the given fraction of the observed
+        values fall, interpolating inside its bucket.
+        """
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            if count and seen + count >= rank:
+                low = self.bounds[index - 1] if index else self.min
+                high = (self.bounds[index] if index < len(self.bounds)
+                        else self.max)
+                low, high = max(low, self.min), min(high, self.max)
+                return low + (high - low) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'buckets': list(zip(self.bounds + [float('inf')], self.buckets)),
+        }
+
+
+class Stats(object):
+
+    """
+    Thread safe collector of the timings and counters of a ``TPB`` instance.
+
+    Page loads record the seconds spent in ``page.fetch`` (connecting and
+    downloading, or waiting for a prefetched page), ``page.decode``,
+    ``page.parse``, ``page.build`` and ``page.total`` along with the
+    ``page.bytes``, ``page.rows`` and ``page.failures`` counters. Torrent
+    details do the same under ``info`` and ``files``, parsing including the
+    extraction. Timings are aggregated into histograms.
+
+    Hooks are called with the metric name, its value and the URL it relates
+    to for every recorded timing or count, e.g. to forward them to a metrics
+    system as they happen.
+    """
+
+    def __init__(self, bounds=None, clock=clock):
+        self.bounds = bounds
+        self.clock = clock
+        self.hooks = []
+        self.histograms = {}
+        self.counters = Counter()
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        """
+        Call hook(name, value, url) for every recorded timing or count.
+        """
+        self.hooks.append(hook)
+
+    def timing(self, name, seconds, url=None):
+        """
+        Record the seconds spent in the named operation.
+        """
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.bounds)
+            histogram.observe(seconds)
+        for hook in self.hooks:
+            hook(name, seconds, url)
+
+    def count(self, name, value=1, url=None):
+        """
+        Increment the named counter by value.
+        """
+        with self._lock:
+            self.counters[name] += value
+        for hook in self.hooks:
+            hook(name, value, url)
+
+    def timer(self, prefix, url=None):
+        """
+        Returns a ``Timer`` recording the successive steps of one operation
+        under prefix.
+        """
+        return Timer(self, prefix, url)
+
+    def snapshot(self):
+        """
+        Returns the counters and the summaries of the histograms as a
+        JSON serializable dictionary.
+        """
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'timings': dict((name, histogram.snapshot())
+                                for name, histogram
+                                in self.histograms.items()),
+            }
+
+    def export(self, namespace='tpb'):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                metric = '{0}_{1}_total'.format(namespace,
+                                                name.replace('.', '_'))
+                lines.append('# TYPE {0} counter'.format(metric))
+                lines.append('{0} {1}'.format(metric, value))
+            for name, histogram in sorted(self.histograms.items()):
+                metric = '{0}_{1}_seconds'.format(namespace,
+                                                  name.replace('.', '_'))
+                lines.append('# TYPE {0} histogram'.format(metric))
+                cumulative = 0
+                bounds = [repr(b) for b in histogram.bounds] + ['+Inf']
+                for bound, count in zip(bounds, histogram.buckets):
+                    cumulative += count
+                    lines.append('{0}_bucket{{le="{1}"}} {2}'.format(
+                        metric, bound, cumulative))
+                lines.append('{0}_sum {1!r}'.format(metric, histogram.sum))
+                lines.append('{0}_count {1}'.format(metric, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """
+        Forget every recorded value.
+        """
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+
+class Timer(object):
+
+    """
+    Times the successive steps of one operation: every lap records the
+    seconds elapsed since the previous one, stop the whole duration.
+    """
+
+    def __init__(self, stats, prefix, url=None):
+        self.stats = stats
+        self.prefix = prefix
+        self.url = url
+        self.start = self.last = stats.clock()
+
+    def lap(self, step):
+        now = self.stats.clock()
+        self.stats.timing(self.prefix + '.' + step, now - self.last, self.url)
+        self.last = now
+
+    def count(self, name, value=1):
+        self.stats.count(self.prefix + '.' + name, value, self.url)
+
+    def stop(self):
+        self.stats.timing(self.prefix + '.total',
+                          self.stats.clock() - self.start, self.url)
+
+
+class NullTimer(object):
+
+    """
+    Timer recording nothing, used when no ``Stats`` is configured.
+    """
+
+    def lap(self, step):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+    def stop(self):
+        pass
+
+
+null_timer = NullTimer()
+
+
+def timer(stats, prefix, url=None):
+    """
+    Returns a timer of stats, or one recording nothing if stats is None.
+    """
+    if stats is None:
+        return null_timer
+    return stats.timer(prefix, url)
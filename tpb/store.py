@@ -0,0 +1,169 @@
+"""
+Persistent SQLite store of scraped torrents.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+
+class Store(object):
+
+    """
+    Thread safe SQLite store upserting torrents by id as they are scraped,
+    along with their info and files once fetched. Stored torrents can be
+    rebuilt without any network access.
+    """
+
+    fields = ['id', 'title', 'url', 'category', 'sub_category', 'magnet_link',
+              'torrent_link', 'comments', 'has_cover', 'user_status',
+              'created', 'scraped', 'size', 'user', 'seeders', 'leechers',
+              'info', 'files', 'updated']
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS torrents (
+            id TEXT PRIMARY KEY,
+            title TEXT,
+            url TEXT,
+            category TEXT,
+            sub_category TEXT,
+            magnet_link TEXT,
+            torrent_link TEXT,
+            comments INTEGER,
+            has_cover TEXT,
+            user_status TEXT,
+            created TEXT,
+            scraped REAL,
+            size TEXT,
+            user TEXT,
+            seeders INTEGER,
+            leechers INTEGER,
+            info TEXT,
+            files TEXT,
+            updated REAL
+        );
+        CREATE INDEX IF NOT EXISTS torrents_category
+            ON torrents (category, sub_category);
+        CREATE INDEX IF NOT EXISTS torrents_user ON torrents (user);
+        CREATE INDEX IF NOT EXISTS torrents_seeders ON torrents (seeders);
+    """
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(self.schema)
+        self._lock = threading.Lock()
+
+    def upsert(self, torrents):
+        """
+        Insert or update the given torrents by id. Already stored info and
+        files are kept unless the torrents carry newer ones.
+        """
+        columns = ', '.join(self.fields)
+        placeholders = ', '.join('?' for _ in self.fields)
+        updates = ', '.join(
+            ('{0} = COALESCE(excluded.{0}, {0})' if field in ('info', 'files')
+             else '{0} = excluded.{0}').format(field)
+            for field in self.fields[1:])
+        query = ('INSERT INTO torrents ({0}) VALUES ({1}) '
+                 'ON CONFLICT (id) DO UPDATE SET {2}'.format(
+                     columns, placeholders, updates))
+        rows = [self._row(torrent) for torrent in torrents]
+        with self._lock:
+            with self._connection:
+                self._connection.executemany(query, rows)
+
+    def update(self, id, field, value):
+        """
+        Store a fetched detail (info or files) of the torrent with given id.
+        """
+        if field == 'files':
+            value = json.dumps(value)
+        query = 'UPDATE torrents SET {0} = ?, updated = ? WHERE id = ?'
+        query = query.format(field)
+        with self._lock:
+            with self._connection:
+                self._connection.execute(query, (value, time.time(), id))
+
+    def detail(self, id, field):
+        """
+        Returns the stored detail (info or files) of the torrent with given
+        id, None if it was never fetched.
+        """
+        query = 'SELECT {0} FROM torrents WHERE id = ?'.format(field)
+        with self._lock:
+            row = self._connection.execute(query, (id,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(row[0]) if field == 'files' else row[0]
+
+    def get(self, id):
+        """
+        Returns the stored torrent with given id, None if there is none.
+        """
+        return next(self.load(id=id), None)
+
+    def load(self, id=None, category=None, user=None, min_seeders=None,
+             torrent_class=None):
+        """
+        Rebuild the stored torrents matching the given criteria, most seeded
+        first, without any network access.
+        """
+        conditions, parameters = [], []
+        for condition, parameter in [('id = ?', id),
+                                     ('category = ?', category),
+                                     ('user = ?', user),
+                                     ('seeders >= ?', min_seeders)]:
+            if parameter is not None:
+                conditions.append(condition)
+                parameters.append(parameter)
+        query = 'SELECT {0} FROM torrents'.format(', '.join(self.fields))
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY seeders DESC'
+        with self._lock:
+            rows = self._connection.execute(query, parameters).fetchall()
+        if torrent_class is None:
+            from .tpb import Torrent as torrent_class
+        for row in rows:
+            yield self._torrent(torrent_class, dict(zip(self.fields, row)))
+
+    def _row(self, torrent):
+        created, scraped = torrent._created
+        files = json.dumps(torrent._files) if torrent._files else None
+        return (torrent.id, torrent.title, str(torrent.url), torrent.category,
+                torrent.sub_category, torrent.magnet_link,
+                torrent.torrent_link, torrent.comments, torrent.has_cover,
+                torrent.user_status, created, scraped, torrent.size,
+                torrent.user, torrent.seeders, torrent.leechers,
+                torrent._info, files, time.time())
+
+    def _torrent(self, torrent_class, row):
+        torrent = torrent_class(
+            row['title'], row['url'], row['category'],
+            row['sub_category'], row['magnet_link'], row['torrent_link'],
+            row['comments'], row['has_cover'], row['user_status'],
+            row['created'], row['size'], row['user'], row['seeders'],
+            row['leechers'], store=self, scraped=row['scraped'])
+        torrent._info = row['info']
+        if row['files'] is not None:
+            torrent._files = json.loads(row['files'])
+        return torrent
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute(
+                'SELECT COUNT(*) FROM torrents').fetchone()[0]
+
+    def close(self):
+        """
+        Close the underlying database connection.
+        """
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -9,21 +9,139 @@ Unofficial Python API for ThePirateBay.
 
 from __future__ import unicode_literals
 
+from collections import Counter, OrderedDict, deque
 import datetime
-import dateutil.parser
 from functools import wraps
-from lxml import html
 import os
 import re
 import sys
 import time
 
-from .utils import URL
-
-from requests import get
+from .columns import to_columns
+from .stats import timer
+from .transport import BlockedError, default_transport
+from .transport import Transport
+from .utils import URL, XPath, parse_size
 
 if sys.version_info >= (3, 0):
+    from urllib.parse import unquote, urlsplit
     unicode = str
+else:
+    from urllib import unquote
+    from urlparse import urlsplit
+
+
+# Statuses of mirrors refusing to serve pages
+BLOCKED_STATUSES = frozenset([403, 429, 503])
+
+
+class BrokenPageError(ValueError):
+
+    """
+    Raised when a page has neither results nor a no hits notice, like
+    truncated pages or captchas, so it is not mistaken for an empty one.
+    """
+
+    def __init__(self, url):
+        super(BrokenPageError, self).__init__(
+            'Page without results nor no hits notice: {0}'.format(url))
+        self.url = url
+
+
+def get(url, transport=None, **kwargs):
+    """
+    Request the URL through the given transport, or through the shared default
+    one if none is given. Raises ``BlockedError`` if the mirror refused to
+    serve it and ``requests.HTTPError`` for other error statuses.
+    """
+    if transport is None:
+        transport = default_transport()
+    response = transport.get(url, **kwargs)
+    if response.status_code in BLOCKED_STATUSES:
+        response.close()
+        raise BlockedError(url, response.status_code)
+    response.raise_for_status()
+    return response
+
+
+def share(source, target, unset=False):
+    """
+    Share the transport, cache, store and stats of source with target, a
+    torrent list or torrent. If unset, target keeps the ones it already has.
+    """
+    for name in ('transport', 'cache', 'store', 'stats'):
+        if not unset or getattr(target, name) is None:
+            setattr(target, name, getattr(source, name))
+    return target
+
+
+_interned = {}
+
+
+def intern(value):
+    """
+    Returns a shared copy of a low cardinality value (categories, statuses...)
+    so torrents don't keep duplicates of the same string.
+    """
+    return _interned.setdefault(value, value)
+
+
+# Number of creation dates parsed by each parser, to notice format changes
+created_parsers = Counter()
+
+_ago = re.compile(r'(\d+) (\w+) ago$')
+_relative_day = re.compile(r'(Today|Y-day)(?: (\d\d):(\d\d))?$')
+_day_time = re.compile(r'(\d\d)-(\d\d) (\d\d):(\d\d)$')
+_day_year = re.compile(r'(\d\d)-(\d\d) (\d{4})$')
+
+
+def parse_created(timestamp, current):
+    """
+    Attempt to parse a human readable torrent creation datetime, relative to
+    the current epoch time it was scraped at. The formats used by TPB are
+    parsed directly, dateutil is only a fallback.
+    """
+    match = _ago.match(timestamp)
+    if match is not None:
+        created_parsers['ago'] += 1
+        quantity, kind = int(match.group(1)), match.group(2)
+        if 'sec' in kind:
+            current -= quantity
+        elif 'min' in kind:
+            current -= quantity * 60
+        elif 'hour' in kind:
+            current -= quantity * 60 * 60
+        return datetime.datetime.fromtimestamp(current)
+    current = datetime.datetime.fromtimestamp(current)
+    match = _relative_day.match(timestamp)
+    if match is not None:
+        created_parsers['relative_day'] += 1
+        day, hour, minute = match.groups()
+        date = current.date()
+        if day == 'Y-day':
+            date -= datetime.timedelta(days=1)
+        return datetime.datetime(date.year, date.month, date.day,
+                                 int(hour or 0), int(minute or 0))
+    try:
+        match = _day_time.match(timestamp)
+        if match is not None:
+            created_parsers['day_time'] += 1
+            month, day, hour, minute = map(int, match.groups())
+            return datetime.datetime(current.year, month, day, hour, minute)
+        match = _day_year.match(timestamp)
+        if match is not None:
+            created_parsers['day_year'] += 1
+            month, day, year = map(int, match.groups())
+            return datetime.datetime(year, month, day)
+    except ValueError:
+        pass
+    created_parsers['dateutil'] += 1
+    import dateutil.parser
+    try:
+        return dateutil.parser.parse(timestamp)
+    except (ValueError, OverflowError):
+        created_parsers['failed'] += 1
+        return current
 
 
 def self_if_parameters(func):
@@ -41,6 +159,54 @@ def self_if_parameters(func):
     return wrapper
 
 
+class RowFilter(object):
+
+    """
+    Criteria on the torrents of a listing. Seeders, leechers and categories
+    are checked on the raw row before the rest of it is extracted into a
+    ``Torrent``, the predicate on the built torrent. Categories are names
+    (main or sub category) or ``CATEGORIES`` numbers, ``CATEGORIES.ALL``
+    matching any category.
+    """
+
+    def __init__(self, min_seeders=None, min_leechers=None, category=None,
+                 predicate=None):
+        self.predicate = predicate
+        self.min_seeders = min_seeders
+        self.min_leechers = min_leechers
+        if category is not None and \
+                not isinstance(category, (list, tuple, set)):
+            category = [category]
+        self.names = self.numbers = None
+        if category is not None:
+            self.names = set(c for c in category
+                             if isinstance(c, (str, unicode)))
+            self.numbers = set(int(c) for c in category
+                               if not isinstance(c, (str, unicode)))
+            # No row links to CATEGORIES.ALL
+            if 0 in self.numbers:
+                self.names = self.numbers = None
+
+    def accepts(self, links, seeders, leechers):
+        """
+        Returns whether a row with the given category links, seeders and
+        leechers matches.
+        """
+        if self.min_seeders is not None and seeders < self.min_seeders:
+            return False
+        if self.min_leechers is not None and leechers < self.min_leechers:
+            return False
+        if self.names is None:
+            return True
+        for link in links:
+            if link.text in self.names:
+                return True
+            number = link.get('href', '').rstrip('/').rsplit('/', 1)[-1]
+            if number.isdigit() and int(number) in self.numbers:
+                return True
+        return False
+
+
 class List(object):
 
     """
@@ -49,33 +215,339 @@ class List(object):
     """
 
     _meta = re.compile('Uploaded (.*), Size (.*), ULed by (.*)')
+    # Precompiled expressions of the fast row parser
+    _cells = XPath('.//td')
+    _links = XPath('.//a')
+    _image_titles = XPath('.//img/@title', smart_strings=False)
+    _meta_text = XPath('string(.//font)', smart_strings=False)
+    _no_hits = XPath('boolean(//h2[contains(., "No hits")])')
+    # Page numbers of the pagination, below or at the end of the table
+    _page_numbers = XPath('//div[@align="center"]/a/text() | '
+                          '//td[@colspan="9"]/a/text()', smart_strings=False)
     base_path = ''
+    _stream = None
+    _where = None  # RowFilter of the torrents to build
+    _limit = None
+    _rows = 0  # rows of the last loaded page, filtered or not
+    _pages = None  # (url, page count) of the last loaded page
+    transport = None
+    cache = None
+    store = None
+    stats = None
 
     def items(self):
         """
         Request URL and parse response. Yield a ``Torrent`` for every torrent
         on page.
         """
-        request = get(str(self.url), headers={'User-Agent' : "Magic Browser","origin_req_host" : "thepiratebay.se"})
-        root = html.fromstring(request.text)
-        items = [self._build_torrent(row) for row in
-                 self._get_torrent_rows(root)]
-        for item in items:
+        for item in self._limited(self._page_items()):
             yield item
 
+    def _page_items(self):
+        """
+        Returns the torrents of the current page, streamed if enabled.
+        """
+        if self._stream:
+            return self._streamed_items(str(self.url))
+        return self._load(str(self.url))
+
+    def _limited(self, items):
+        """
+        Yield the items up to the limit, then stop the underlying iteration
+        so no other page is requested.
+        """
+        if self._limit is None:
+            for item in items:
+                yield item
+            return
+        try:
+            if self._limit > 0:
+                for count, item in enumerate(items, 1):
+                    yield item
+                    if count == self._limit:
+                        return
+        finally:
+            if hasattr(items, 'close'):
+                items.close()
+
+    def limit(self, count):
+        """
+        Stop iterating after count torrents, without requesting any other
+        page.
+        """
+        self._limit = count
+        return self
+
+    def filter(self, min_seeders=None, min_leechers=None, category=None,
+               predicate=None):
+        """
+        Only yield the torrents with at least min_seeders seeders and
+        min_leechers leechers, in category (a name, a ``CATEGORIES`` number or
+        a list of them) and for which predicate(torrent) is true. All but the
+        predicate are checked before building the torrents. Filtered lists
+        are neither read from nor saved to the cache.
+        """
+        self._where = None
+        if (min_seeders, min_leechers, category, predicate) != \
+                (None, None, None, None):
+            self._where = RowFilter(min_seeders, min_leechers, category,
+                                    predicate)
+        return self
+
+    @property
+    def _page_cache(self):
+        """
+        The cache of pages, None if filtered rows would make them partial.
+        """
+        return self.cache if self._where is None else None
+
+    def stream(self, chunk_size=8192):
+        """
+        Enable streaming mode: the response is parsed incrementally while it
+        downloads and every torrent is yielded as soon as its row is complete.
+        """
+        self._stream = chunk_size
+        return self
+
+    def _streamed_items(self, url):
+        """
+        Yield the torrents of the page at url as their rows are downloaded.
+        Rows already processed are freed so memory stays flat, torrents are
+        only kept until the end of the page to be cached or stored at once.
+        """
+        items = self._cached(url)
+        if items is not None:
+            for item in items:
+                yield item
+            return
+        cache = self._page_cache
+        keep = cache is not None or self.store is not None
+        from lxml import etree
+        watch = timer(self.stats, 'page', url)
+        request = get(url, self.transport, stream=True)
+        watch.lap('fetch')
+        parser = etree.HTMLPullParser(events=('end',),
+                                      tag=('tr', 'table', 'h2'),
+                                      encoding=request.encoding)
+        origin = self._origin()
+        items, built, size, complete, no_hits = [], 0, 0, False, False
+        self._rows = 0
+        try:
+            for chunk in request.iter_content(self._stream):
+                size += len(chunk)
+                parser.feed(chunk)
+                for _, element in parser.read_events():
+                    if element.tag == 'h2':
+                        no_hits = no_hits or 'No hits' in element.xpath(
+                            'string()')
+                        continue
+                    # Only the first table holds torrents
+                    if element.tag == 'table':
+                        complete = True
+                        return
+                    # Skip header and pagination footer rows
+                    if len(element) > 1 and element[0].tag == 'td':
+                        self._rows += 1
+                        try:
+                            item = self._build_row(element, origin)
+                        except Exception:
+                            watch.count('failures')
+                            raise
+                        if item is not None:
+                            if keep:
+                                items.append(item)
+                            built += 1
+                            yield item
+                    # Free the processed rows
+                    element.clear()
+                    while element.getprevious() is not None:
+                        del element.getparent()[0]
+            # The page ended before the end of a table of results
+            if not no_hits:
+                raise BrokenPageError(url)
+            complete = True
+        finally:
+            request.close()
+            watch.count('bytes', size)
+            watch.count('rows', built)
+            watch.stop()
+            # Store the torrents yielded, even if the page was not consumed
+            if self.store is not None and items:
+                self.store.upsert(items)
+            # Only cache pages that were entirely consumed, their pagination
+            # is not read
+            if complete:
+                self._pages = (url, None)
+                self._cache_page(url, items, size)
+
+    def _load(self, url, request=None):
+        """
+        Returns the torrents of the page at url, from the cache if possible.
+        An already started request for that url may be given.
+        """
+        if request is None:
+            items = self._cached(url)
+            if items is not None:
+                return items
+        watch = timer(self.stats, 'page', url)
+        if request is None:
+            request = get(url, self.transport)
+        watch.lap('fetch')
+        text = request.text
+        watch.lap('decode')
+        watch.count('bytes', len(request.content))
+        self._rows = 0  # set while building the torrents
+        items = self._parse(text, url)
+        watch.count('rows', len(items))
+        watch.stop()
+        self._cache_page(url, items, len(text))
+        if self.store is not None:
+            self.store.upsert(items)
+        return items
+
+    def _cached(self, url):
+        """
+        Returns the torrents cached for the page at url, restoring its counts
+        of rows and pages, None if it is not cached.
+        """
+        cache = self._page_cache
+        entry = None if cache is None else cache.get(url)
+        if entry is None:
+            return None
+        items, self._rows, pages = entry
+        self._pages = (url, pages)
+        return items
+
+    def _cache_page(self, url, items, size):
+        """
+        Cache the torrents of the page at url along with its counts of rows
+        and pages.
+        """
+        cache = self._page_cache
+        if cache is not None:
+            cache.set(url, (items, self._rows, self._page_total(url)),
+                      self.base_path, size)
+
+    def _page_total(self, url):
+        """
+        Returns the page count read from the pagination of the page at url if
+        it was the last one loaded, None otherwise.
+        """
+        if self._pages is not None and self._pages[0] == url:
+            return self._pages[1]
+        return None
+
+    def _parse(self, text, url=None):
+        """
+        Parse a torrent listing page (the one at url, the current one by
+        default) and build a ``Torrent`` for every row.
+        """
+        from lxml import etree
+        if url is None:
+            url = str(self.url)
+        watch = timer(self.stats, 'page', url)
+        try:
+            page = etree.HTML(text)
+            watch.lap('parse')
+            items = self._build_torrents(page, url)
+            watch.lap('build')
+        except Exception:
+            watch.count('failures')
+            raise
+        return items
+
+    def _origin(self):
+        """
+        Returns the scheme and location torrent paths are joined to, the same
+        way ``purl`` does.
+        """
+        url = self.url.build()
+        if url.host() is None:
+            return ''
+        return '{0}://{1}'.format(url.scheme(), url.netloc())
+
     def __iter__(self):
         return self.items()
 
     def _get_torrent_rows(self, page):
         """
         Returns all 'tr' tag rows as a list of tuples. Each tuple is for
-        a single torrent.
+        a single torrent. Raises ``BrokenPageError`` if the page has no table
+        of results nor a no hits notice.
         """
+        if page is None:  # nothing could be parsed at all
+            raise BrokenPageError(str(self.url))
         table = page.find('.//table')  # the table with all torrent listing
-        if table is None:  # no table means no results:
+        if table is None:  # no table means no results or a broken page
+            if not self._no_hits(page):
+                raise BrokenPageError(str(self.url))
             return []
         else:
-            return table.findall('.//tr')[1:]  # get all rows but header
+            # get all rows but header and the pagination footer
+            return [row for row in table.findall('.//tr')[1:]
+                    if len(row) > 1]
+
+    def _build_torrents(self, page, url=None):
+        """
+        Builds and returns a Torrent object for every row of the given parsed
+        page (the one at url, the current one by default). Fast equivalent of
+        ``_build_torrent`` using precompiled expressions and building the base
+        URL once per page.
+        """
+        origin = self._origin()
+        rows = self._get_torrent_rows(page)
+        self._rows = len(rows)
+        numbers = [int(n) for n in self._page_numbers(page) if n.isdigit()]
+        if url is None:
+            url = str(self.url)
+        self._pages = (url, max(numbers + [int(bool(rows))]))
+        items = [self._build_row(row, origin) for row in rows]
+        if self._where is not None:
+            items = [item for item in items if item is not None]
+        return items
+
+    def _build_row(self, row, origin):
+        """
+        Builds and returns a Torrent object for the given parsed row, joining
+        its path to origin, or None if the row does not match the filter.
+        """
+        cols = self._cells(row)
+        categories = self._links(cols[0])
+        seeders, leechers = int(cols[2].text), int(cols[3].text)
+        if (self._where is not None and
+                not self._where.accepts(categories, seeders, leechers)):
+            return None
+        category, sub_category = [c.text for c in categories]
+        links = self._links(cols[1])
+        title = unicode(links[0].text)
+        href = links[0].get('href')
+        url = origin + (href if href.startswith('/') else '/' + href)
+        magnet_link = links[1].get('href')
+        torrent_link = links[2].get('href') if len(links) > 2 else None
+        if torrent_link is not None and not torrent_link.endswith('.torrent'):
+            torrent_link = None
+        comments = 0
+        has_cover = 'No'
+        for image_title in self._image_titles(cols[1]):
+            if 'comments' in image_title:
+                comments = int(image_title.split(' ')[3])
+            if 'cover' in image_title:
+                has_cover = 'Yes'
+        user_status = 'MEMBER'
+        if links[-2].get('href').startswith('/user/'):
+            user_status = links[-2].find('.//img').get('title')
+        meta = self._meta.match(self._meta_text(cols[1]))
+        created, size, user = meta.groups()
+        torrent = self._torrent(
+            title, url, category, sub_category, magnet_link, torrent_link,
+            comments, has_cover, user_status, created.replace('\xa0', ' '),
+            size.replace('\xa0', ' '), user, seeders, leechers,
+            transport=self.transport, cache=self.cache, store=self.store,
+            stats=self.stats)
+        if self._where is not None and self._where.predicate is not None and \
+                not self._where.predicate(torrent):
+            return None
+        return torrent
 
     def _build_torrent(self, row):
         """
@@ -121,11 +593,25 @@ class List(object):
         # last 2 columns for seeders and leechers
         seeders = int(cols[2].text)
         leechers = int(cols[3].text)
-        t = Torrent(title, url, category, sub_category, magnet_link,
-                    torrent_link, comments, has_cover, user_status, created,
-                    size, user, seeders, leechers)
+        t = self._torrent(title, url, category, sub_category, magnet_link,
+                          torrent_link, comments, has_cover, user_status,
+                          created, size, user, seeders, leechers,
+                          transport=self.transport, cache=self.cache,
+                          store=self.store)
         return t
 
+    def _torrent(self, *args, **kwargs):
+        """
+        Torrent factory, overridden by lists yielding other torrent types.
+        """
+        return Torrent(*args, **kwargs)
+
+    def to_columns(self, use_numpy=None):
+        """
+        Returns the torrents of this list as columns, see ``to_columns``.
+        """
+        return to_columns(self, use_numpy)
+
 
 class Paginated(List):
 
@@ -137,6 +623,11 @@ class Paginated(List):
     def __init__(self, *args, **kwargs):
         super(Paginated, self).__init__(*args, **kwargs)
         self._multipage = False
+        self._prefetch = 0
+        self._parallel = None
+        self._pipeline = None
+        self._dedup = None
+        self.duplicates = 0
 
     def items(self):
         """
@@ -144,30 +635,225 @@ class Paginated(List):
         on page. If in multipage mode, Torrents from next pages are
         automatically chained.
         """
-        if self._multipage:
+        items = self._paginated_items()
+        if self._dedup is not None:
+            items = self._deduplicated(items)
+        for item in self._limited(items):
+            yield item
+
+    def _deduplicated(self, items):
+        """
+        Drop the torrents already yielded by this iteration, counting them in
+        duplicates.
+        """
+        create, key = self._dedup
+        seen = create()
+        self.duplicates = 0
+        for item in items:
+            if seen.add(key(item)):
+                yield item
+            else:
+                self.duplicates += 1
+
+    def _paginated_items(self):
+        """
+        Yield the torrents of the current page, or of every page from the
+        current one in multipage mode.
+        """
+        if self._multipage and self._pipeline is not None:
+            from .pipeline import crawl
+            for item in crawl(self, **self._pipeline):
+                yield item
+        elif self._multipage and self._parallel:
+            for item in self._parallel_items():
+                yield item
+        elif self._multipage and self._prefetch:
+            for item in self._prefetched_items():
+                yield item
+        elif self._multipage:
             while True:
                 # Pool for more torrents
-                items = super(Paginated, self).items()
-                # Stop if no more torrents
-                first = next(items, None)
-                if first is None:
-                    raise StopIteration()
-                # Yield them if not
-                else:
-                    yield first
-                    for item in items:
-                        yield item
+                empty = True
+                for item in super(Paginated, self).items():
+                    empty = False
+                    yield item
+                # Stop if no more torrents, filtered out or not
+                if empty and not self._rows:
+                    return
                 # Go to the next page
                 self.next()
         else:
             for item in super(Paginated, self).items():
                 yield item
 
-    def multipage(self):
+    def _prefetched_items(self):
         """
-        Enable multipage iteration.
+        Multipage iteration downloading the next pages in background threads
+        while the current one is consumed. Pages are still yielded in order.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        executor = ThreadPoolExecutor(max_workers=self._prefetch + 1)
+        pending = deque()
+        ahead = self.page()
+        try:
+            while True:
+                # Keep the current page and the prefetched ones in flight
+                while len(pending) <= self._prefetch:
+                    pending.append((ahead,) +
+                                   self._submit_page(executor, ahead))
+                    ahead += 1
+                items = self._load_page(*pending.popleft())
+                if not self._rows:
+                    return
+                for item in items:
+                    yield item
+        finally:
+            # Drop the pages not needed anymore
+            for _, _, future in pending:
+                if future is not None:
+                    future.cancel()
+            executor.shutdown(wait=False)
+
+    def _parallel_items(self):
+        """
+        Multipage iteration loading the current page, then requesting all the
+        pages it links to at once, at most concurrency at a time. Pages are
+        yielded in order, or as soon as they are downloaded if not ordered.
+        Pages linked from later pages are requested as they are discovered.
+        """
+        from concurrent.futures import (FIRST_COMPLETED, ThreadPoolExecutor,
+                                        wait)
+        concurrency, ordered = self._parallel
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        pending = OrderedDict()  # (url, future or None) by page number
+        ahead = self.page() + 1
+        try:
+            items = self._load(str(self.url))
+            count = self.page_count()
+            for item in items:
+                yield item
+            while True:
+                # Keep the known pages left in flight
+                while ahead < count and len(pending) < concurrency:
+                    pending[ahead] = self._submit_page(executor, ahead)
+                    ahead += 1
+                if not pending:
+                    return
+                if ordered:
+                    number = next(iter(pending))
+                else:
+                    futures = [f for _, f in pending.values()
+                               if f is not None]
+                    if len(futures) == len(pending):
+                        wait(futures, return_when=FIRST_COMPLETED)
+                    number = next(n for n, (_, f) in pending.items()
+                                  if f is None or f.done())
+                url, future = pending.pop(number)
+                items = self._load_page(number, url, future)
+                if ordered and not self._rows:
+                    return
+                count = max(count, self._page_total(url) or 0)
+                for item in items:
+                    yield item
+        finally:
+            for _, future in pending.values():
+                if future is not None:
+                    future.cancel()
+            executor.shutdown(wait=False)
+
+    def _page_url(self, number):
+        """
+        Returns the URL of the given page without changing the current one.
+        """
+        return self.url.build(page=str(number)).as_string()
+
+    def _submit_page(self, executor, number):
+        """
+        Start downloading the given page with executor unless it is cached.
+        Returns its URL and the future of the request, None if cached.
+        """
+        url = self._page_url(number)
+        cache = self._page_cache
+        if cache is not None and url in cache:
+            return url, None
+        return url, executor.submit(get, url, self.transport)
+
+    def _load_page(self, number, url, future):
+        """
+        Returns the torrents of a page submitted with ``_submit_page``. The
+        list is kept on the page being loaded, like in multipage mode.
+        """
+        self.page(number)
+        return self._load(url, future and future.result())
+
+    def page_count(self):
+        """
+        Returns the number of result pages as shown by the pagination links
+        of the current page, loading it unless it was the last loaded one.
+        TPB only links a window of pages around the current one so deeper
+        pages may exist.
+        """
+        url = str(self.url)
+        if self._page_total(url) is None:
+            self._load(url)
+        if self._page_total(url) is None:
+            # Streamed pages are not parsed past their table of results
+            self._load(url, get(url, self.transport))
+        return max(self._page_total(url) or 0,
+                   self.page() + 1 if self._rows else 0)
+
+    def multipage(self, prefetch=0):
+        """
+        Enable multipage iteration. If prefetch is given, that many pages
+        ahead of the current one are downloaded in the background.
         """
         self._multipage = True
+        self._prefetch = prefetch
+        self._parallel = self._pipeline = None
+        return self
+
+    def parallel(self, concurrency=8, ordered=True):
+        """
+        Enable multipage iteration requesting all the pages counted from the
+        pagination links at once, at most concurrency at a time. Torrents
+        are yielded in page order, or page by page as soon as they are
+        downloaded if not ordered.
+        """
+        self.multipage()
+        self._parallel = (concurrency, ordered)
+        return self
+
+    def pipeline(self, processes=None, concurrency=8, ordered=True,
+                 backlog=None, executor=None):
+        """
+        Enable multipage iteration downloading pages in threads and parsing
+        them in processes, see ``tpb.pipeline.crawl``.
+        """
+        self.multipage()
+        self._pipeline = {'processes': processes, 'concurrency': concurrency,
+                          'ordered': ordered, 'backlog': backlog,
+                          'executor': executor}
+        return self
+
+    def dedup(self, capacity=100000, bloom=False, error_rate=0.001,
+              key='id'):
+        """
+        Drop the torrents seen earlier in the same iteration, like the ones
+        shifting to the next page as new torrents are uploaded. Keys (the
+        torrent 'id' or magnet 'infohash') are remembered in a set of at most
+        capacity keys, or in a Bloom filter sized for capacity keys at the
+        given false positive rate. The number of dropped torrents is kept in
+        duplicates.
+        """
+        from . import dedup
+        if bloom:
+            def create():
+                return dedup.BloomFilter(capacity, error_rate)
+        else:
+            def create():
+                return dedup.SeenSet(capacity)
+        keys = {'id': dedup.torrent_id, 'infohash': dedup.infohash}
+        self._dedup = (create, keys[key])
         return self
 
     @self_if_parameters
@@ -254,6 +940,53 @@ class Recent(Paginated):
                        defaults=[str(page)],
                        )
 
+    def feed(self, watermark=None, oldest_first=False, max_pages=None):
+        """
+        Yield only the torrents uploaded after the given ``Watermark``,
+        walking pages from the current one until reaching already ingested
+        torrents, at most max_pages of them. Without watermark only max_pages
+        (one by default) are read. The watermark is advanced to the newest
+        yielded torrent once the feed is exhausted, or after each torrent
+        when yielding oldest first.
+        """
+        from .feed import Watermark
+        if watermark is None:
+            watermark = Watermark()
+        if max_pages is None and watermark.empty:
+            max_pages = 1
+        return self._feed(watermark, oldest_first, max_pages)
+
+    def _feed(self, watermark, oldest_first, max_pages):
+        from .feed import Watermark
+        new, seen = [], set()
+        newest = Watermark(watermark.id, watermark.timestamp)
+        number = self.page()
+        while max_pages is None or number - self.page() < max_pages:
+            items = self._load(self._page_url(number))
+            reached = not self._rows
+            for item in items:
+                if watermark.covers(item):
+                    reached = True
+                    break
+                # Rows shift to the next page as torrents are uploaded
+                if item.id in seen:
+                    continue
+                seen.add(item.id)
+                if oldest_first:
+                    new.append(item)
+                else:
+                    newest.advance(item)
+                    yield item
+            if reached:
+                break
+            number += 1
+        if oldest_first:
+            for item in reversed(new):
+                yield item
+                watermark.advance(item)
+        else:
+            watermark.id, watermark.timestamp = newest.id, newest.timestamp
+
 
 class Top(List):
 
@@ -283,109 +1016,293 @@ class TPB(object):
 
     """
     TPB API with searching, most recent torrents and top torrents support.
-    Passes on base_url to the instantiated Search, Recent and Top classes.
+    Passes on base_url, a pooled transport, an optional response cache, an
+    optional persistent store and optional ``Stats`` instrumentation to the
+    instantiated Search, Recent and Top classes. Extra keyword arguments
+    (headers, timeout, pool_size...) configure the transport unless one is
+    given. If base_url is a list of mirrors, requests are spread over them by
+    a ``MirrorTransport`` (see its hedge_after, alpha, max_error_rate and
+    cooldown arguments).
     """
 
-    def __init__(self, base_url):
+    def __init__(self, base_url, transport=None, cache=None, store=None,
+                 stats=None, **kwargs):
+        if isinstance(base_url, (list, tuple)):
+            if transport is None:
+                from .mirrors import MirrorTransport
+                transport = MirrorTransport(base_url, **kwargs)
+            base_url = base_url[0]
         self.base_url = base_url
+        if transport is None:
+            transport = Transport(**kwargs)
+        self.transport = transport
+        self.cache = cache
+        self.store = store
+        self.stats = stats
+
+    def _bind(self, torrents):
+        """
+        Share this instance's transport, cache, store and stats with the given
+        torrent list or torrent.
+        """
+        return share(self, torrents)
+
+    def hydrate(self, torrents, info=True, files=True, concurrency=8):
+        """
+        Fetch the info and/or files of many torrents in parallel, with at most
+        concurrency requests in flight. Yield a (torrent, error) tuple for
+        every torrent as soon as it is done, error being None on success.
+        """
+        def fetch(torrent):
+            if info:
+                torrent.info
+            if files:
+                torrent.files
+
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor
+        from concurrent.futures import wait
+        torrents = iter(torrents)
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        pending = {}
+        try:
+            while True:
+                # Fill the window lazily so torrents can be a generator
+                for torrent in torrents:
+                    share(self, torrent, unset=True)
+                    pending[executor.submit(fetch, torrent)] = torrent
+                    if len(pending) >= concurrency:
+                        break
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.exception()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def close(self):
+        """
+        Close the pooled connections of this instance.
+        """
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
-    def search(self, query, page=0, order=7, category=0, multipage=False):
+    def search(self, query, page=0, order=7, category=0, multipage=False,
+               prefetch=0, limit=None):
         """
         Searches TPB for query and returns a list of paginated Torrents capable
         of changing query, categories and orders.
         """
-        search = Search(self.base_url, query, page, order, category)
+        search = self._bind(Search(self.base_url, query, page, order,
+                                   category))
         if multipage:
-            search.multipage()
-        return search
+            search.multipage(prefetch)
+        return search.limit(limit)
 
-    def recent(self, page=0):
+    def fan_out(self, queries, categories=(0,), order=7, limit=None,
+                concurrency=8):
+        """
+        Searches every query in every category concurrently and yields their
+        results as one list sorted by order, each torrent once. Deeper pages
+        are only fetched until limit torrents were yielded. Type orders can't
+        be merged.
+        """
+        from .fanout import merge
+        if isinstance(queries, (str, unicode)):
+            queries = [queries]
+        searches = [self.search(query, order=order, category=category)
+                    for query in queries for category in categories]
+        return merge(searches, order, limit, concurrency)
+
+    def recent(self, page=0, limit=None):
         """
         Lists most recent Torrents added to TPB.
         """
-        return Recent(self.base_url, page)
+        return self._bind(Recent(self.base_url, page)).limit(limit)
 
-    def top(self, category=0):
+    def top(self, category=0, limit=None):
         """
         Lists top Torrents on TPB optionally filtering by category.
         """
-        return Top(self.base_url, category)
+        return self._bind(Top(self.base_url, category)).limit(limit)
 
 
 class Torrent(object):
 
     """
-    Holder of a single TPB torrent.
+    Holder of a single TPB torrent. Compact by design as crawls keep lots of
+    them around: no per instance dict, interned categorical values and the
+    URL kept as a string.
     """
 
+    __slots__ = ['title', '_url', 'id', 'category', 'sub_category',
+                 'magnet_link', 'torrent_link', 'comments', 'has_cover',
+                 'user_status', '_created', '_parsed', 'timestamp', 'size',
+                 'size_bytes', 'user', 'seeders', 'leechers', '_info',
+                 '_files', 'transport', 'cache', 'store', 'stats']
+    # Fields pickled, all but the shared resources listed last
+    _pickled = __slots__[:-4]
+
     def __init__(self, title, url, category, sub_category, magnet_link,
                  torrent_link, comments, has_cover, user_status, created,
-                 size, user, seeders, leechers):
+                 size, user, seeders, leechers, transport=None, cache=None,
+                 store=None, scraped=None, stats=None):
         self.title = title  # the title of the torrent
         self.url = url  # TPB url for the torrent
-        self.id = self.url.path_segments()[1]
-        self.category = category  # the main category
-        self.sub_category = sub_category  # the sub category
+        self.id = unquote(urlsplit(self._url).path.split('/')[2])
+        self.category = intern(category)  # the main category
+        self.sub_category = intern(sub_category)  # the sub category
         self.magnet_link = magnet_link  # magnet download link
         self.torrent_link = torrent_link  # .torrent download link
         self.comments = comments
-        self.has_cover = has_cover
-        self.user_status = user_status
-        self._created = (created, time.time())  # uploaded date, current time
+        self.has_cover = intern(has_cover)
+        self.user_status = intern(user_status)
+        if scraped is None:
+            scraped = time.time()
+        self._created = (created, scraped)  # uploaded date, scraping time
+        self._parsed = None  # _created and its parsed datetime, once read
+        self.timestamp = time.mktime(
+            parse_created(*self._created).timetuple())  # uploaded
         self.size = size  # size of torrent
+        self.size_bytes = parse_size(size)  # size of torrent in bytes
         self.user = user  # username of uploader
         self.seeders = seeders  # number of seeders
         self.leechers = leechers  # number of leechers
         self._info = None
-        self._files = {}
+        self._files = None
+        self.transport = transport  # shared HTTP transport
+        self.cache = cache  # shared response cache
+        self.store = store  # shared persistent store
+        self.stats = stats  # shared instrumentation
+
+    def __getstate__(self):
+        """
+        Pickle the data fields only as a tuple, dropping the shared resources
+        and the memoized creation date.
+        """
+        return tuple(None if name == '_parsed' else getattr(self, name)
+                     for name in self._pickled)
+
+    def __setstate__(self, state):
+        for name, value in zip(self._pickled, state):
+            setattr(self, name, value)
+        for name in ('category', 'sub_category', 'has_cover',
+                     'user_status'):
+            setattr(self, name, intern(getattr(self, name)))
+        self.transport = self.cache = self.store = self.stats = None
+
+    @property
+    def url(self):
+        """
+        TPB url for the torrent, rebuilt from its string form.
+        """
+        from purl import URL as PURL
+        return PURL(self._url)
+
+    @url.setter
+    def url(self, url):
+        if not isinstance(url, (str, unicode)):
+            url = url.as_string()
+        self._url = url
 
     @property
     def info(self):
         if self._info is None:
-            request = get(str(self.url), headers={'User-Agent' : "Magic Browser","origin_req_host" : "thepiratebay.se"})
-            root = html.fromstring(request.text)
-            info = root.cssselect('#details > .nfo > pre')[0].text_content()
-            self._info = info
+            self._info = self._load(str(self.url), self._parse_info, 'info')
         return self._info
 
     @property
     def files(self):
         if not self._files:
-            path = '/ajax_details_filelist.php?id={id}'.format(id=self.id)
-            url = self.url.path(path)
-            request = get(str(url), headers={'User-Agent' : "Magic Browser","origin_req_host" : "thepiratebay.se"})
-            root = html.fromstring(request.text)
-            rows = root.findall('.//tr')
-            for row in rows:
-                name, size = [unicode(v.text_content())
-                              for v in row.findall('.//td')]
-                self._files[name] = size.replace('\xa0', ' ')
+            self._files = self._load(str(self._files_url()),
+                                     self._parse_files, 'files')
         return self._files
 
+    def _load(self, url, parse, field):
+        """
+        Returns the parsed details page at url, from the store or the cache if
+        possible. Freshly fetched details are saved in the store as field.
+        """
+        if self.store is not None:
+            value = self.store.detail(self.id, field)
+            if value is not None:
+                return value
+        if self.cache is not None:
+            value = self.cache.get(url)
+            if value is not None:
+                return value
+        watch = timer(self.stats, field, url)
+        request = get(url, self.transport)
+        watch.lap('fetch')
+        text = request.text
+        watch.lap('decode')
+        watch.count('bytes', len(request.content))
+        try:
+            value = parse(text)
+        except Exception:
+            watch.count('failures')
+            raise
+        watch.lap('parse')
+        watch.stop()
+        if self.cache is not None:
+            self.cache.set(url, value, '/torrent', len(text))
+        if self.store is not None:
+            self.store.update(self.id, field, value)
+        return value
+
+    def _files_url(self):
+        """
+        Returns the URL of the file listing of this torrent.
+        """
+        path = '/ajax_details_filelist.php?id={id}'.format(id=self.id)
+        return self.url.path(path)
+
+    @staticmethod
+    def _parse_info(text):
+        """
+        Extract the detailed description from a torrent details page.
+        """
+        from lxml import html
+        root = html.fromstring(text)
+        return root.cssselect('#details > .nfo > pre')[0].text_content()
+
+    @staticmethod
+    def _parse_files(text):
+        """
+        Extract a dictionary of file names and sizes from a file listing.
+        """
+        from lxml import html
+        root = html.fromstring(text)
+        files = {}
+        for row in root.findall('.//tr'):
+            name, size = [unicode(v.text_content())
+                          for v in row.findall('.//td')]
+            files[name] = size.replace('\xa0', ' ')
+        return files
+
     @property
     def created(self):
         """
-        Attempt to parse the human readable torrent creation datetime.
-        """
-        timestamp, current = self._created
-        if timestamp.endswith('ago'):
-            quantity, kind, ago = timestamp.split()
-            quantity = int(quantity)
-            if 'sec' in kind:
-                current -= quantity
-            elif 'min' in kind:
-                current -= quantity * 60
-            elif 'hour' in kind:
-                current -= quantity * 60 * 60
-            return datetime.datetime.fromtimestamp(current)
-        current = datetime.datetime.fromtimestamp(current)
-        timestamp = timestamp.replace(
-            'Y-day', str(current.date() - datetime.timedelta(days=1)))
-        timestamp = timestamp.replace('Today', current.date().isoformat())
-        try:
-            return dateutil.parser.parse(timestamp)
-        except:
-            return current
+        Attempt to parse the human readable torrent creation datetime. The
+        result is kept until _created changes.
+        """
+        if self._parsed is None or self._parsed[0] is not self._created:
+            self._parsed = (self._created, parse_created(*self._created))
+        return self._parsed[1]
+
+    @property
+    def ratio(self):
+        """
+        Seeders per leecher, the number of seeders if there are no leechers.
+        """
+        return self.seeders / float(max(self.leechers, 1))
 
     def print_torrent(self):
         """
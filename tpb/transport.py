@@ -0,0 +1,263 @@
+"""
+Pooled HTTP transport shared by every request of a TPB instance.
+"""
+
+from collections import deque
+import random
+import threading
+import time
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+
+
+class BlockedError(IOError):
+
+    """
+    Raised when a mirror keeps refusing to serve a page (403, 429 or 503)
+    after every retry, as opposed to a page without results.
+    """
+
+    def __init__(self, url, status):
+        super(BlockedError, self).__init__(
+            'Blocked with status {0} requesting {1}'.format(status, url))
+        self.url = url
+        self.status = status
+
+
+class RateLimiter(object):
+
+    """
+    Thread safe token bucket rate limiter per host, adapting its rate to the
+    throttling it observes: every 429 multiplies the rate of the host by
+    decrease, every other response adds increase requests per second to it,
+    up to max_rate. Hosts are not limited until a rate is given or a first
+    429 is observed, the rate then starts from decrease times the rate of the
+    requests of the last second.
+    """
+
+    def __init__(self, rate=None, burst=1, max_rate=None, min_rate=0.1,
+                 increase=0.1, decrease=0.5, clock=time.time,
+                 sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.max_rate = rate if max_rate is None else max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.clock = clock
+        self.sleep = sleep
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, host):
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = {
+                'rate': self.rate,
+                'tokens': float(self.burst),
+                'updated': self.clock(),
+                'sent': deque(),  # times of the requests of the last second
+            }
+        return bucket
+
+    def rate_of(self, host):
+        """
+        Returns the current rate of host in requests per second, None if it
+        is not limited.
+        """
+        with self._lock:
+            return self._bucket(host)['rate']
+
+    def acquire(self, host):
+        """
+        Wait until a request to host is allowed.
+        """
+        while True:
+            with self._lock:
+                bucket = self._bucket(host)
+                now = self.clock()
+                sent = bucket['sent']
+                sent.append(now)
+                while sent[0] <= now - 1:
+                    sent.popleft()
+                rate = bucket['rate']
+                if rate is None:
+                    return
+                tokens = min(self.burst, bucket['tokens'] +
+                             (now - bucket['updated']) * rate)
+                bucket['updated'] = now
+                if tokens >= 1:
+                    bucket['tokens'] = tokens - 1
+                    return
+                bucket['tokens'] = tokens
+                sent.pop()
+                wait = (1 - tokens) / rate
+            self.sleep(wait)
+
+    def throttled(self, host):
+        """
+        Slow down the requests to host after a 429.
+        """
+        with self._lock:
+            bucket = self._bucket(host)
+            rate = bucket['rate']
+            if rate is None:
+                rate = float(max(len(bucket['sent']), 1))
+            bucket['rate'] = max(self.min_rate, rate * self.decrease)
+
+    def succeeded(self, host):
+        """
+        Speed up the requests to host after a response that was not a 429.
+        """
+        with self._lock:
+            bucket = self._bucket(host)
+            if bucket['rate'] is None:
+                return
+            rate = bucket['rate'] + self.increase
+            if self.max_rate is not None:
+                rate = min(self.max_rate, rate)
+            bucket['rate'] = rate
+
+
+class Transport(object):
+
+    """
+    Keep-alive HTTP transport backed by a ``requests.Session``. Connections
+    are pooled per host so consecutive page loads reuse the same TCP/TLS
+    connection instead of opening a new one. The session is created on the
+    first request.
+
+    Requests go through a ``RateLimiter`` shared by every request of the
+    transport, limited to rate requests per second per host if given. Failed
+    connections and transient statuses are retried up to retries times after
+    a jittered exponential backoff, honouring Retry-After headers.
+    """
+
+    # Statuses worth retrying
+    retry_statuses = frozenset([429, 500, 502, 503, 504])
+
+    headers = {
+        'User-Agent': 'Magic Browser',
+        'origin_req_host': 'thepiratebay.se',
+    }
+
+    def __init__(self, headers=None, timeout=30, pool_size=10,
+                 pool_connections=10, pool_block=False, rate=None, burst=1,
+                 retries=3, backoff=0.5, max_backoff=30, limiter=None):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        if limiter is None:
+            limiter = RateLimiter(rate, burst)
+        self.limiter = limiter
+        self.pool_size = pool_size
+        self.pool_connections = pool_connections
+        self.pool_block = pool_block
+        self._headers = dict(self.headers)
+        if headers is not None:
+            self._headers.update(headers)
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """
+        The pooled ``requests.Session``, created on first use.
+        """
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+
+    def _create_session(self):
+        from requests import Session
+        from requests.adapters import HTTPAdapter
+        session = Session()
+        session.headers.update(self._headers)
+        adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                              pool_maxsize=self.pool_size,
+                              pool_block=self.pool_block)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def get(self, url, **kwargs):
+        """
+        Request the given URL through the pooled session, retrying transient
+        failures. Returns the last response once out of retries.
+        """
+        return self._get(url, self.retries, **kwargs)
+
+    def _get(self, url, retries, **kwargs):
+        """
+        Request the given URL retrying transient failures up to retries times.
+        """
+        from requests.exceptions import ConnectionError, Timeout
+        kwargs.setdefault('timeout', self.timeout)
+        url = str(url)
+        host = urlsplit(url).netloc
+        attempt = 0
+        while True:
+            self.limiter.acquire(host)
+            retry_after = None
+            try:
+                response = self.session.get(url, **kwargs)
+            except (ConnectionError, Timeout):
+                if attempt >= retries:
+                    raise
+            else:
+                if response.status_code == 429:
+                    self.limiter.throttled(host)
+                else:
+                    self.limiter.succeeded(host)
+                if (response.status_code not in self.retry_statuses or
+                        attempt >= retries):
+                    return response
+                retry_after = response.headers.get('Retry-After')
+                response.close()
+            self.limiter.sleep(self._delay(attempt, retry_after))
+            attempt += 1
+
+    def _delay(self, attempt, retry_after=None):
+        """
+        Returns the seconds to wait before the given retry: a random delay up
+        to an exponentially growing bound, at least Retry-After seconds if
+        given as a number, and at most max_backoff.
+        """
+        delay = random.uniform(0, self.backoff * 2 ** attempt)
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, int(retry_after))
+        return min(delay, self.max_backoff)
+
+    def close(self):
+        """
+        Close every pooled connection.
+        """
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_default = None
+
+
+def default_transport():
+    """
+    Returns the transport shared by lists and torrents not bound to a ``TPB``
+    instance, creating it on first use.
+    """
+    global _default
+    if _default is None:
+        _default = Transport()
+    return _default
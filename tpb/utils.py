@@ -1,6 +1,9 @@
 from collections import OrderedDict
+import re
 
-from purl import URL as PURL
+
+# Segments classes already created, by segment names
+_url_classes = {}
 
 
 def URL(base, path, segments=None, defaults=None):
@@ -9,16 +12,19 @@ def URL(base, path, segments=None, defaults=None):
     URL is constructed by joining base, path and segments.
 
     For each segment a property capable of getting and setting that segment is
-    created dynamically.
+    created dynamically. Classes are created once per segment names.
     """
-    # Make a copy of the Segments class
-    url_class = type(Segments.__name__, Segments.__bases__,
-                     dict(Segments.__dict__))
     segments = [] if segments is None else segments
     defaults = [] if defaults is None else defaults
-    # For each segment attach a property capable of getting and setting it
-    for segment in segments:
-        setattr(url_class, segment, url_class._segment(segment))
+    key = tuple(segments)
+    url_class = _url_classes.get(key)
+    if url_class is None:
+        # Make a subclass of the Segments class
+        url_class = type(Segments.__name__, (Segments,), {})
+        # For each segment attach a property capable of getting and setting it
+        for segment in segments:
+            setattr(url_class, segment, url_class._segment(segment))
+        url_class = _url_classes.setdefault(key, url_class)
     # Instantiate the class with the actual parameters
     return url_class(base, path, segments, defaults)
 
@@ -27,30 +33,46 @@ class Segments(object):
 
     """
     URL segment handler, not intended for direct use. The URL is constructed by
-    joining base, path and segments.
+    joining base, path and segments. The built URL is kept until a segment is
+    set.
     """
 
     def __init__(self, base, path, segments, defaults):
+        from purl import URL as PURL
         # Preserve the base URL
         self.base = PURL(base, path=path)
+        self._base_segments = None
         # Map the segments and defaults lists to an ordered dict
         self.segments = OrderedDict(zip(segments, defaults))
+        self._url = None
+        self._string = None
 
-    def build(self):
-        # Join base segments and segments
-        segments = self.base.path_segments() + tuple(self.segments.values())
+    def build(self, **overrides):
+        if not overrides and self._url is not None:
+            return self._url
+        # Join base segments and segments, overriding the given ones
+        values = [overrides.get(name, value)
+                  for name, value in self.segments.items()]
+        if self._base_segments is None:
+            self._base_segments = self.base.path_segments()
+        segments = self._base_segments + tuple(values)
         # Create a new URL with the segments replaced
         url = self.base.path_segments(segments)
+        if not overrides:
+            self._url = url
         return url
 
     def __str__(self):
-        return self.build().as_string()
+        if self._string is None:
+            self._string = self.build().as_string()
+        return self._string
 
     def _get_segment(self, segment):
         return self.segments[segment]
 
     def _set_segment(self, segment, value):
         self.segments[segment] = value
+        self._url = self._string = None
 
     @classmethod
     def _segment(cls, segment):
@@ -61,3 +83,39 @@ class Segments(object):
             fget=lambda x: cls._get_segment(x, segment),
             fset=lambda x, v: cls._set_segment(x, segment, v),
         )
+
+
+_size = re.compile(r'([\d.]+)\s*([KMGTP]?i?B)', re.IGNORECASE)
+_units = {'': 1, 'K': 2 ** 10, 'M': 2 ** 20, 'G': 2 ** 30, 'T': 2 ** 40,
+          'P': 2 ** 50}
+
+
+def parse_size(size):
+    """
+    Returns the number of bytes of a human readable size such as "1.2 GiB",
+    None if it can't be parsed.
+    """
+    match = _size.search(size or '')
+    if match is None:
+        return None
+    quantity, unit = match.groups()
+    return int(float(quantity) * _units[unit[:-1].rstrip('iI').upper()])
+
+
+class XPath(object):
+
+    """
+    Precompiled XPath expression, compiled on first use so lxml is only
+    imported once something gets parsed.
+    """
+
+    def __init__(self, path, **kwargs):
+        self.path = path
+        self.kwargs = kwargs
+        self._xpath = None
+
+    def __get__(self, instance, owner):
+        if self._xpath is None:
+            from lxml import etree
+            self._xpath = etree.XPath(self.path, **self.kwargs)
+        return self._xpath